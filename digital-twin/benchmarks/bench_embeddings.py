@@ -0,0 +1,93 @@
+"""
+Startup and encode latency of the embedding backends (EMBED_BACKEND).
+
+    python -m benchmarks.bench_embeddings [--backends torch onnx onnx-int8] [--repeat 50] [--batch 64]
+
+Each backend runs in a fresh interpreter so import and model load are measured cold.
+The onnx backends need `pip install optimum[onnxruntime]`.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import numpy as np
+
+SAMPLE_CODE = [
+    f"def handler_{i}(request, session):\n"
+    f"    user = session.query(User).filter_by(id=request.user_id).first()\n"
+    f"    return {{'status': {i}, 'items': [x.to_dict() for x in user.items[:{i % 17 + 1}]]}}\n"
+    for i in range(256)
+]
+
+def run_backend(backend, repeat, batch):
+    started = time.perf_counter()
+    from src.services import load_embed_model
+    imported = time.perf_counter()
+    model = load_embed_model(backend)
+    loaded = time.perf_counter()
+    model.encode(SAMPLE_CODE[:1], convert_to_numpy=True)
+    first = time.perf_counter()
+
+    single = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        model.encode(SAMPLE_CODE[i % len(SAMPLE_CODE)], convert_to_numpy=True)
+        single.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    vectors = model.encode(SAMPLE_CODE, batch_size=batch, convert_to_numpy=True)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "backend": backend,
+        "import_s": imported - started,
+        "load_s": loaded - imported,
+        "first_encode_s": first - loaded,
+        "single_p50_ms": float(np.percentile(single, 50)) * 1000,
+        "single_p95_ms": float(np.percentile(single, 95)) * 1000,
+        "batch_texts_per_s": len(SAMPLE_CODE) / batch_seconds,
+        "vectors": vectors.astype(np.float32).tolist(),
+    }
+
+def cosine_agreement(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    a /= np.linalg.norm(a, axis=1, keepdims=True)
+    b /= np.linalg.norm(b, axis=1, keepdims=True)
+    return float(np.min(np.sum(a * b, axis=1)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_backend(args.child, args.repeat, args.batch)))
+        return
+
+    results = {}
+    for backend in args.backends:
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_embeddings", "--child", backend,
+             "--repeat", str(args.repeat), "--batch", str(args.batch)],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"{backend:<10} failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        results[backend] = result
+        print(f"{backend:<10} import {result['import_s']:5.2f}s  load {result['load_s']:5.2f}s  "
+              f"first {result['first_encode_s'] * 1000:7.1f} ms  single p50 {result['single_p50_ms']:6.2f} ms  "
+              f"p95 {result['single_p95_ms']:6.2f} ms  batch {result['batch_texts_per_s']:7.1f} texts/s")
+
+    reference = results.get("torch")
+    for backend, result in results.items():
+        if reference and backend != "torch":
+            print(f"{backend:<10} min cosine vs torch: {cosine_agreement(reference['vectors'], result['vectors']):.4f}")
+
+if __name__ == "__main__":
+    main()
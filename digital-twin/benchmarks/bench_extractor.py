@@ -0,0 +1,98 @@
+"""
+Micro-benchmark: query-based extract_units vs. the previous recursive walk.
+
+    python -m benchmarks.bench_extractor [--functions 2000] [--depth 6] [--repeat 3]
+"""
+import argparse
+import time
+from src.parser import extract_units, get_cached_parser, generate_footprint, DEFINITION_TYPES, CALL_TYPES
+
+def legacy_extract_units(content, lang_name):
+    """The recursive walk/find_calls extractor the query version replaced, kept as the baseline."""
+    tree = get_cached_parser(lang_name).parse(content)
+    results = []
+
+    def walk(node):
+        if node.type in DEFINITION_TYPES:
+            name_node = node.child_by_field_name('name')
+            func_name = content[name_node.start_byte:name_node.end_byte].decode('utf-8', errors='ignore') if name_node else "anonymous"
+            func_body = content[node.start_byte:node.end_byte].decode('utf-8', errors='ignore')
+            calls = []
+
+            def find_calls(n):
+                if n.type in CALL_TYPES:
+                    name_id_node = n.child_by_field_name('function')
+                    if name_id_node:
+                        call_name = content[name_id_node.start_byte:name_id_node.end_byte].decode('utf-8', errors='ignore')
+                        calls.append(call_name.split(".")[-1])
+                for child in n.children:
+                    find_calls(child)
+
+            find_calls(node)
+            results.append({
+                "name": func_name,
+                "start_byte": node.start_byte, "end_byte": node.end_byte,
+                "start_line": node.start_point[0] + 1, "end_line": node.end_point[0] + 1,
+                "footprint": generate_footprint(func_body),
+                "calls": list(set(calls))
+            })
+        for child in node.children:
+            walk(child)
+
+    walk(tree.root_node)
+    return results
+
+def make_python_source(functions, depth):
+    lines = []
+    for i in range(functions):
+        for d in range(depth):
+            indent = "    " * d
+            lines.append(f"{indent}def f{i}_{d}(x):")
+            lines.append(f"{indent}    y = helper_{d}(x) + self.obj.method_{i % 7}(x)")
+        lines.append("    " * depth + f"return f{(i + 1) % functions}_0(y)")
+        lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+def make_javascript_source(functions, depth):
+    parts = []
+    for i in range(functions):
+        body = f"return next{i}(x) + this.util.call{i % 5}(x);"
+        for d in reversed(range(depth)):
+            body = f"function f{i}_{d}(x) {{ helper{d}(x); {body} }}"
+        parts.append(body)
+        parts.append(f"class C{i} {{ m{i}(a) {{ return f{i}_0(a) + this.n(a); }} }}")
+    return "\n".join(parts).encode("utf-8")
+
+def normalise(units):
+    return [{**unit, "calls": sorted(unit["calls"])} for unit in units]
+
+def time_it(fn, content, lang_name, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(content, lang_name)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--functions", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sources = {
+        "python": make_python_source(args.functions, args.depth),
+        "javascript": make_javascript_source(args.functions, args.depth),
+    }
+    for lang_name, content in sources.items():
+        query_units = extract_units(content, lang_name)
+        assert normalise(query_units) == normalise(legacy_extract_units(content, lang_name)), f"{lang_name}: outputs differ"
+
+        legacy = time_it(legacy_extract_units, content, lang_name, args.repeat)
+        query = time_it(extract_units, content, lang_name, args.repeat)
+        print(f"{lang_name:<11} {len(content) / 1024:8.0f} KiB  {len(query_units):6d} units  "
+              f"walk {legacy * 1000:8.1f} ms  query {query * 1000:8.1f} ms  speedup {legacy / query:5.1f}x")
+
+if __name__ == "__main__":
+    main()
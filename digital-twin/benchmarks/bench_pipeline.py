@@ -0,0 +1,199 @@
+"""
+End-to-end benchmark of ingestion, risk analysis and chat against local stand-ins:
+a synthetic git repo, an in-process fake Supabase and a fake OpenAI-compatible server.
+
+    python -m benchmarks.bench_pipeline [--files 200] [--functions 10] [--fan-out 3]
+        [--llm-latency-ms 200] [--db-latency-ms 2] [--changed-files 10] [--queries 20] [--json out.json]
+
+Reports wall time, DB round trips and LLM calls per ingestion stage, then the same for
+a risk re-run, an incremental push sync and chat queries (cold and answer-cached).
+Embeddings use the configured model (EMBED_BACKEND), so its weights must be available.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+BENCH_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Progress messages that belong to the stage already running
+FOLDED_MESSAGES = ("Enriching", "Removed", "Dependency graph", "Push touched")
+PROCESSING_STAGE = "Parsing and enriching files"
+
+class StageRecorder:
+    """status_callback that splits a run into stages by its log messages and charges DB/LLM usage to each."""
+
+    def __init__(self, db, llm):
+        self.db = db
+        self.llm = llm
+        self.stages = []
+        self.progress = {}
+        self.error = None
+        self._mark()
+
+    def _mark(self):
+        self._started = time.perf_counter()
+        self._db_calls = self.db.total_calls()
+        self._llm_calls = self.llm.calls
+
+    def _close(self):
+        if self.stages and "seconds" not in self.stages[-1]:
+            self.stages[-1].update({
+                "seconds": time.perf_counter() - self._started,
+                "db_calls": self.db.total_calls() - self._db_calls,
+                "llm_calls": self.llm.calls - self._llm_calls,
+            })
+
+    def _open(self, name):
+        self._close()
+        self._mark()
+        self.stages.append({"stage": name})
+
+    def __call__(self, step, log_message=None, error=None, progress=None):
+        if progress:
+            self.progress.update(progress)
+            # Per-file progress has no log line, so the first update opens its own stage
+            if self.stages[-1]["stage"] != PROCESSING_STAGE:
+                self._open(PROCESSING_STAGE)
+        if error:
+            self.error = error
+        if step in ("DONE", "Error"):
+            self._close()
+            return
+        if log_message and not log_message.startswith(FOLDED_MESSAGES):
+            self._open(log_message.rstrip("."))
+
+def measure(db, llm, fn, *args):
+    db_before, llm_before = db.total_calls(), llm.calls
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, {
+        "seconds": time.perf_counter() - started,
+        "db_calls": db.total_calls() - db_before,
+        "llm_calls": llm.calls - llm_before,
+    }
+
+def print_stages(title, stages):
+    print(f"\n{title}")
+    print(f"  {'stage':<42} {'seconds':>9} {'db calls':>9} {'llm calls':>10}")
+    for stage in stages:
+        print(f"  {stage['stage'][:42]:<42} {stage.get('seconds', 0):9.3f} {stage.get('db_calls', 0):9d} {stage.get('llm_calls', 0):10d}")
+    total = sum(s.get("seconds", 0) for s in stages)
+    print(f"  {'total':<42} {total:9.3f} {sum(s.get('db_calls', 0) for s in stages):9d} {sum(s.get('llm_calls', 0) for s in stages):10d}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--functions", type=int, default=10)
+    parser.add_argument("--fan-out", type=int, default=3)
+    parser.add_argument("--legacy-fraction", type=float, default=0.4)
+    parser.add_argument("--recent-fraction", type=float, default=0.3)
+    parser.add_argument("--commits", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--db-latency-ms", type=float, default=2)
+    parser.add_argument("--changed-files", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    from benchmarks.fake_llm import FakeLLMServer
+    llm = FakeLLMServer(latency_ms=args.llm_latency_ms).start()
+
+    workdir = tempfile.mkdtemp(prefix="lumis-bench-")
+    # The app reads these at import time; the benchmark must never reach real services
+    os.environ.update({
+        "SUPABASE_URL": "http://fake-supabase.invalid", "SUPABASE_KEY": "fake",
+        "OPENROUTER_API_KEY": "fake", "LLM_BASE_URL": llm.base_url,
+        "LUMIS_CACHE_PATH": os.path.join(workdir, "content_cache.sqlite3"),
+        "VECTOR_INDEX_DIR": os.path.join(workdir, "vector_index"),
+    })
+    if BENCH_ROOT not in sys.path:
+        sys.path.insert(0, BENCH_ROOT)
+
+    from benchmarks.fake_supabase import FakeSupabase, install_fake_supabase
+    from benchmarks.synthetic_repo import generate_repo, mutate_repo
+    from main import run_ingestion_for_user, run_incremental_sync
+    from src.risk_engine import calculate_predictive_risks
+    from chat import ask_twin_supabase
+
+    db = FakeSupabase(latency_ms=args.db_latency_ms)
+    install_fake_supabase(db)
+
+    source_path = os.path.join(workdir, "source")
+    started = time.perf_counter()
+    repo, ages = generate_repo(
+        source_path, args.files, args.functions, args.fan_out,
+        args.legacy_fraction, args.recent_fraction, commits=args.commits, seed=args.seed
+    )
+    print(f"Generated {args.files} files x {args.functions} functions in {time.perf_counter() - started:.2f}s "
+          f"({sum(a > 120 for a in ages.values())} legacy, {sum(a < 30 for a in ages.values())} recent files)")
+
+    # Workspaces (temp_projects/...) are relative to the working directory
+    os.chdir(workdir)
+    project_id = db.table("projects").insert({"user_id": "bench", "repo_url": source_path, "last_commit": "pending"}).execute().data[0]["id"]
+    repo_url = f"file://{source_path}"
+    results = {"config": vars(args)}
+
+    # 1. Full ingestion
+    recorder = StageRecorder(db, llm)
+    _, total = measure(db, llm, run_ingestion_for_user, repo_url, "bench", project_id, recorder)
+    if recorder.error:
+        raise SystemExit(f"Ingestion failed: {recorder.error}")
+    print_stages("Full ingestion", recorder.stages)
+    units = recorder.progress.get("units_scanned", 0)
+    print(f"  throughput: {args.files / total['seconds']:.1f} files/s, {units / total['seconds']:.1f} units/s "
+          f"({units} units, {recorder.progress.get('units_enriched', 0)} enriched)")
+    results["full_ingestion"] = {"total": total, "stages": recorder.stages, "progress": recorder.progress}
+
+    # 2. Risk analysis again, with the analyses now cached
+    risk_count, risk = measure(db, llm, calculate_predictive_risks, project_id)
+    print(f"\nRisk re-run: {risk_count} risks in {risk['seconds']:.3f}s, {risk['db_calls']} db calls, {risk['llm_calls']} llm calls")
+    results["risk_rerun"] = {**risk, "risks": risk_count}
+
+    # 3. Incremental sync of one push
+    before, after = mutate_repo(repo, args.changed_files, args.functions, args.fan_out, seed=args.seed + 1)
+    recorder = StageRecorder(db, llm)
+    _, total = measure(db, llm, run_incremental_sync, repo_url, "bench", project_id, before, after,
+                       f"refs/heads/{repo.active_branch.name}", recorder)
+    if recorder.error:
+        raise SystemExit(f"Incremental sync failed: {recorder.error}")
+    print_stages(f"Incremental sync ({args.changed_files} changed files)", recorder.stages)
+    results["incremental_sync"] = {"total": total, "stages": recorder.stages, "progress": recorder.progress}
+
+    # 4. Chat, cold then answered from the cache
+    queries = [f"What breaks if m{i % args.files}_f{i % args.functions} changes its return type?" for i in range(args.queries)]
+    for label in ("cold", "cached"):
+        latencies = []
+        db_before, llm_before = db.total_calls(), llm.calls
+        for query in queries:
+            started = time.perf_counter()
+            ask_twin_supabase(query, project_id)
+            latencies.append(time.perf_counter() - started)
+        chat = {
+            "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+            "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+            "db_calls_per_query": (db.total_calls() - db_before) / len(queries),
+            "llm_calls_per_query": (llm.calls - llm_before) / len(queries),
+        }
+        print(f"\nChat ({label}, {len(queries)} queries): p50 {chat['p50_ms']:.1f} ms  p95 {chat['p95_ms']:.1f} ms  "
+              f"{chat['db_calls_per_query']:.1f} db calls/query  {chat['llm_calls_per_query']:.2f} llm calls/query")
+        results[f"chat_{label}"] = chat
+
+    print("\nDB round trips by table/operation:")
+    for key, count in sorted(db.calls.items(), key=lambda item: -item[1]):
+        print(f"  {key:<28} {count:7d}")
+    print(f"LLM: {llm.calls} calls, ~{llm.prompt_tokens} prompt tokens, ~{llm.completion_tokens} completion tokens")
+    results["db_calls"] = dict(db.calls)
+    results["llm"] = {"calls": llm.calls, "prompt_tokens": llm.prompt_tokens, "completion_tokens": llm.completion_tokens}
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    llm.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Recall/latency benchmark: local IVF vector index vs. exact brute-force search.
+
+    python -m benchmarks.bench_vector_index [--vectors 50000] [--queries 200] [--k 8] [--nprobe 4 8 16 32]
+
+Vectors are synthetic clustered unit-norm embeddings of the MiniLM dimension.
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+from src.vector_index import LocalVectorIndex, EMBED_DIM
+
+def make_vectors(count, clusters, rng):
+    centers = rng.standard_normal((clusters, EMBED_DIM)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((count, EMBED_DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--clusters", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.vectors, args.clusters, rng)
+    queries = make_vectors(args.queries, args.clusters, rng)
+    names = [f"file_{i // 20}.py::f{i}" for i in range(args.vectors)]
+
+    latencies, exact = [], []
+    for query in queries:
+        start = time.perf_counter()
+        scores = vectors @ query
+        top = np.argpartition(-scores, args.k)[:args.k]
+        latencies.append(time.perf_counter() - start)
+        exact.append({names[i] for i in top})
+    print(f"{'brute force':<22} recall 1.000  p50 {percentile_ms(latencies, 50):7.3f} ms  p95 {percentile_ms(latencies, 95):7.3f} ms")
+
+    for dtype in ("float32", "int8"):
+        with tempfile.TemporaryDirectory() as path:
+            index = LocalVectorIndex(path, dtype=dtype)
+            start = time.perf_counter()
+            for i in range(0, args.vectors, 1000):
+                index.upsert(names[i:i + 1000], vectors[i:i + 1000])
+            index.train()
+            build = time.perf_counter() - start
+            print(f"{dtype}: built {args.vectors} vectors, {len(index.centroids)} lists in {build:.2f}s")
+
+            for nprobe in args.nprobe:
+                latencies, hits = [], 0
+                for query, truth in zip(queries, exact):
+                    start = time.perf_counter()
+                    found = index.search(query, args.k, nprobe=nprobe)
+                    latencies.append(time.perf_counter() - start)
+                    hits += len(truth & {name for name, _ in found})
+                recall = hits / (args.k * len(queries))
+                print(f"  {dtype:<7} nprobe {nprobe:<5}  recall {recall:.3f}  "
+                      f"p50 {percentile_ms(latencies, 50):7.3f} ms  p95 {percentile_ms(latencies, 95):7.3f} ms")
+
+if __name__ == "__main__":
+    main()
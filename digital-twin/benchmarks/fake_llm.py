@@ -0,0 +1,98 @@
+"""
+OpenAI-compatible chat completion server for benchmarks. Answers every request after
+a configurable latency (plus an optional per-token delay when streaming) and counts
+calls and approximate tokens. Point LLM_BASE_URL at `FakeLLMServer.base_url`.
+"""
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = (
+    "The caller now passes a normalised value where the legacy callee still assumes raw input; "
+    "check the argument types and null handling before relying on it."
+)
+
+class FakeLLMServer:
+    def __init__(self, latency_ms=200.0, token_delay_ms=0.0, answer=ANSWER):
+        self.latency = latency_ms / 1000
+        self.token_delay = token_delay_ms / 1000
+        self.answer = answer
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _record(self, request):
+        prompt_chars = sum(len(message.get("content") or "") for message in request.get("messages", []))
+        prompt_tokens = prompt_chars // 4
+        completion_tokens = len(self.answer) // 4
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+        return prompt_tokens, completion_tokens
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                prompt_tokens, completion_tokens = server._record(request)
+                time.sleep(server.latency)
+                model = request.get("model", "fake")
+
+                if not request.get("stream"):
+                    body = json.dumps({
+                        "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": server.answer}}],
+                        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                  "total_tokens": prompt_tokens + completion_tokens},
+                    }).encode("utf-8")
+                    return self._send(200, "application/json", body)
+
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("connection", "close")
+                self.end_headers()
+                for word in server.answer.split(" "):
+                    if server.token_delay:
+                        time.sleep(server.token_delay)
+                    chunk = {"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                             "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
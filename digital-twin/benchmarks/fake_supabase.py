@@ -0,0 +1,268 @@
+"""
+In-process stand-in for the slice of the supabase-py client this codebase uses:
+table().select/insert/upsert/update/delete with eq/gt/in_/order/limit/range/maybe_single
+(writes honour count= and returning=),
+and rpc("match_memory_units"). Every execute() counts as one round trip and can sleep
+for a configurable latency, so benchmarks see the cost of chatty access patterns.
+AsyncFakeSupabase serves the same tables to the async client's awaitable execute().
+"""
+import sys
+import time
+import asyncio
+import uuid
+import threading
+import itertools
+from collections import Counter
+import numpy as np
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+        self.count = None
+
+class FakeQuery:
+    def __init__(self, db, table, action, payload=None, on_conflict=None, ignore_duplicates=False, count=None, returning=None):
+        self.db = db
+        self.table = table
+        self.action = action
+        self.payload = payload
+        self.on_conflict = on_conflict
+        self.ignore_duplicates = ignore_duplicates
+        self.count = count
+        self.returning = getattr(returning, "value", returning)
+        self.columns = None
+        self.filters = []
+        self.orders = []
+        self.row_limit = None
+        self.row_range = None
+        self.single = False
+
+    def select(self, columns="*"):
+        self.columns = columns
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] > value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def range(self, start, end):
+        self.row_range = (start, end)
+        return self
+
+    def maybe_single(self):
+        self.single = True
+        return self
+
+    def _matches(self, row):
+        return all(f(row) for f in self.filters)
+
+    def _project(self, row):
+        if not self.columns or self.columns.strip() == "*":
+            return dict(row)
+        return {column.strip(): row.get(column.strip()) for column in self.columns.split(",")}
+
+    def execute(self):
+        return self.db.execute(self)
+
+class AsyncFakeQuery(FakeQuery):
+    async def execute(self):
+        if self.db.latency:
+            await asyncio.sleep(self.db.latency)
+        return self.db.execute(self, sleep=False)
+
+class FakeTable:
+    def __init__(self, db, name, query_class=FakeQuery):
+        self.db = db
+        self.name = name
+        self.query_class = query_class
+
+    def select(self, columns="*"):
+        return self.query_class(self.db, self.name, "select").select(columns)
+
+    def insert(self, payload, count=None, returning=None):
+        return self.query_class(self.db, self.name, "insert", payload, count=count, returning=returning)
+
+    def upsert(self, payload, on_conflict=None, ignore_duplicates=False, count=None, returning=None):
+        return self.query_class(self.db, self.name, "upsert", payload, on_conflict, ignore_duplicates, count, returning)
+
+    def update(self, payload, count=None, returning=None):
+        return self.query_class(self.db, self.name, "update", payload, count=count, returning=returning)
+
+    def delete(self, count=None, returning=None):
+        return self.query_class(self.db, self.name, "delete", count=count, returning=returning)
+
+class FakeRpc:
+    def __init__(self, db, name, params):
+        self.db = db
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        return self.db.execute_rpc(self.name, self.params)
+
+class AsyncFakeRpc(FakeRpc):
+    async def execute(self):
+        if self.db.latency:
+            await asyncio.sleep(self.db.latency)
+        return self.db.execute_rpc(self.name, self.params, sleep=False)
+
+class FakeSupabase:
+    """Tables are lists of row dicts; upserts use a per-conflict-key index rebuilt after deletes."""
+
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000
+        self.tables = {}
+        self.calls = Counter()
+        self._indexes = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return FakeTable(self, name)
+
+    def rpc(self, name, params):
+        return FakeRpc(self, name, params)
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def _round_trip(self, key, sleep=True):
+        self.calls[key] += 1
+        if sleep and self.latency:
+            time.sleep(self.latency)
+
+    def _index(self, table, key_columns):
+        index = self._indexes.get((table, key_columns))
+        if index is None:
+            index = {tuple(row.get(c) for c in key_columns): row for row in self.tables.get(table, [])}
+            self._indexes[(table, key_columns)] = index
+        return index
+
+    def _new_row(self, table, row):
+        row = dict(row)
+        if "id" not in row:
+            row["id"] = str(uuid.uuid4()) if table == "projects" else next(self._ids)
+        self.tables.setdefault(table, []).append(row)
+        for (indexed_table, key_columns), index in self._indexes.items():
+            if indexed_table == table:
+                index[tuple(row.get(c) for c in key_columns)] = row
+        return row
+
+    def _write_response(self, query, rows):
+        response = FakeResponse([] if query.returning == "minimal" else rows)
+        response.count = len(rows) if query.count else None
+        return response
+
+    def execute(self, query, sleep=True):
+        self._round_trip(f"{query.table}.{query.action}", sleep)
+        with self._lock:
+            rows = self.tables.setdefault(query.table, [])
+            payload = query.payload
+            if isinstance(payload, dict):
+                payload = [payload]
+
+            if query.action == "insert":
+                return self._write_response(query, [dict(self._new_row(query.table, row)) for row in payload])
+
+            if query.action == "upsert":
+                key_columns = tuple(c.strip() for c in (query.on_conflict or "id").split(","))
+                index = self._index(query.table, key_columns)
+                written = []
+                for row in payload:
+                    existing = index.get(tuple(row.get(c) for c in key_columns))
+                    if existing is None:
+                        written.append(dict(self._new_row(query.table, row)))
+                    elif not query.ignore_duplicates:
+                        existing.update(row)
+                        written.append(dict(existing))
+                return self._write_response(query, written)
+
+            matched = [row for row in rows if query._matches(row)]
+
+            if query.action == "update":
+                for row in matched:
+                    row.update(query.payload)
+                self._indexes = {k: v for k, v in self._indexes.items() if k[0] != query.table}
+                return self._write_response(query, [dict(row) for row in matched])
+
+            if query.action == "delete":
+                matched_ids = {id(row) for row in matched}
+                self.tables[query.table] = [row for row in rows if id(row) not in matched_ids]
+                self._indexes = {k: v for k, v in self._indexes.items() if k[0] != query.table}
+                return self._write_response(query, [dict(row) for row in matched])
+
+            for column, desc in reversed(query.orders):
+                matched.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+            if query.row_range:
+                start, end = query.row_range
+                matched = matched[start:end + 1]
+            if query.row_limit is not None:
+                matched = matched[:query.row_limit]
+            data = [query._project(row) for row in matched]
+            if query.single:
+                return FakeResponse(data[0]) if data else None
+            return FakeResponse(data)
+
+    def execute_rpc(self, name, params, sleep=True):
+        self._round_trip(f"rpc.{name}", sleep)
+        if name != "match_memory_units":
+            raise ValueError(f"Unknown RPC {name}")
+        with self._lock:
+            rows = [
+                row for row in self.tables.get("memory_units", [])
+                if row.get("project_id") == params["filter_project_id"] and row.get("embedding") is not None
+            ]
+        if not rows:
+            return FakeResponse([])
+        matrix = np.array([row["embedding"] for row in rows], dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        query = np.asarray(params["query_embedding"], dtype=np.float32)
+        scores = matrix @ (query / max(np.linalg.norm(query), 1e-12))
+        order = np.argsort(-scores)[:params["match_count"]]
+        return FakeResponse([
+            {
+                "unit_name": rows[i]["unit_name"], "file_path": rows[i].get("file_path"),
+                "content": rows[i].get("content"), "summary": rows[i].get("summary"),
+                "risk_score": rows[i].get("risk_score", 0), "similarity": float(scores[i]),
+            }
+            for i in order if scores[i] > params["match_threshold"]
+        ])
+
+class AsyncFakeSupabase:
+    """The async client's view of a FakeSupabase: same tables and call counts, awaitable execute()."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def table(self, name):
+        return FakeTable(self.db, name, AsyncFakeQuery)
+
+    def rpc(self, name, params):
+        return AsyncFakeRpc(self.db, name, params)
+
+def install_fake_supabase(fake):
+    """Points every loaded module that imported the real client, and the async client, at `fake`."""
+    from src import db_client, async_db
+    original = db_client.supabase
+    for module in list(sys.modules.values()):
+        if getattr(module, "supabase", None) is original:
+            module.supabase = fake
+    async_db._async_supabase = AsyncFakeSupabase(fake)
+    return original
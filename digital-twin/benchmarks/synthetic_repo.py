@@ -0,0 +1,87 @@
+"""
+Synthetic git repositories for ingestion benchmarks: Python modules whose functions call
+each other across files, committed with backdated dates so the risk engine sees a mix
+of legacy, middle-aged and recently touched code.
+"""
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from git import Repo, Actor
+
+AUTHORS = [Actor(f"dev{i}", f"dev{i}@example.com") for i in range(5)]
+
+def sample_age_days(rng, legacy_fraction, recent_fraction, max_age_days):
+    """Recent (< 30 days), legacy (> 120 days) or in between, in the given proportions."""
+    roll = rng.random()
+    if roll < recent_fraction:
+        return rng.uniform(1, 29)
+    if roll < recent_fraction + legacy_fraction:
+        return rng.uniform(121, max(122, max_age_days))
+    return rng.uniform(31, 119)
+
+def module_path(file_index):
+    return f"pkg{file_index // 20}/mod_{file_index}.py"
+
+def function_name(file_index, function_index):
+    return f"m{file_index}_f{function_index}"
+
+def render_module(file_index, functions, fan_out, total_files, rng, revision=0):
+    lines = [f'"""Synthetic module {file_index} (revision {revision})."""', ""]
+    for f in range(functions):
+        callees = [
+            function_name(rng.randrange(total_files), rng.randrange(functions))
+            for _ in range(fan_out)
+        ]
+        lines.append(f"def {function_name(file_index, f)}(value, options=None):")
+        lines.append(f"    total = value * {f + 1} + {revision}")
+        for callee in callees:
+            lines.append(f"    total += {callee}(total % 7, options)")
+        lines.append("    return total")
+        lines.append("")
+    return "\n".join(lines)
+
+def _commit(repo, paths, message, when, author):
+    repo.index.add(paths)
+    date = when.strftime("%Y-%m-%dT%H:%M:%S%z")
+    return repo.index.commit(message, author=author, committer=author, author_date=date, commit_date=date)
+
+def generate_repo(path, files=200, functions_per_file=10, fan_out=3, legacy_fraction=0.4,
+                  recent_fraction=0.3, max_age_days=400, commits=20, seed=0):
+    """
+    Creates a repository at `path`. Files are grouped into `commits` commits in age order,
+    each dated by its files' sampled age. Returns the repo and the file ages in days.
+    """
+    rng = random.Random(seed)
+    repo = Repo.init(path)
+    now = datetime.now(timezone.utc)
+
+    ages = {module_path(i): sample_age_days(rng, legacy_fraction, recent_fraction, max_age_days) for i in range(files)}
+    ordered = sorted(ages, key=lambda p: -ages[p])
+    group_size = max(1, -(-len(ordered) // commits))
+
+    for start in range(0, len(ordered), group_size):
+        group = ordered[start:start + group_size]
+        for rel_path in group:
+            file_index = int(rel_path.rsplit("_", 1)[1][:-3])
+            full_path = os.path.join(path, rel_path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "w") as f:
+                f.write(render_module(file_index, functions_per_file, fan_out, files, rng))
+        # The group's youngest file dates the commit
+        when = now - timedelta(days=min(ages[p] for p in group))
+        _commit(repo, group, f"Add {len(group)} modules", when, rng.choice(AUTHORS))
+    return repo, ages
+
+def mutate_repo(repo, changed_files, functions_per_file=10, fan_out=3, seed=1):
+    """Rewrites `changed_files` random modules in one new commit. Returns (before_sha, after_sha)."""
+    rng = random.Random(seed)
+    before = repo.head.commit.hexsha
+    tracked = sorted(p for p in repo.git.ls_files().splitlines() if p.endswith(".py"))
+    total_files = len(tracked)
+    chosen = rng.sample(tracked, min(changed_files, total_files))
+    for rel_path in chosen:
+        file_index = int(rel_path.rsplit("_", 1)[1][:-3])
+        with open(os.path.join(repo.working_tree_dir, rel_path), "w") as f:
+            f.write(render_module(file_index, functions_per_file, fan_out, total_files, rng, revision=seed))
+    commit = _commit(repo, chosen, f"Change {len(chosen)} modules", datetime.now(timezone.utc), rng.choice(AUTHORS))
+    return before, commit.hexsha
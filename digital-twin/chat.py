@@ -1,108 +1,238 @@
+import re
+import asyncio
 import traceback
-from src.services import get_embedding, get_llm_completion
-from src.db_client import supabase, get_project_risks
+from src.async_services import aget_embedding, aget_llm_completion, astream_llm_completion, run_sync
+from src.async_db import aget_project_risks, amatch_memory_units, aget_unit_source_codes, aget_unit_rows
+from src.cache import query_embedding_cache, answer_cache
+from src.graph_cache import get_project_graph
+from src.vector_index import search_vector_index
+from src.metrics import span
 
-def get_relevant_context(query, project_id):
+MATCH_THRESHOLD = 0.2
+MATCH_COUNT = 8
+# Columns match_memory_units returns for each retrieved unit
+CONTEXT_COLUMNS = "unit_name, file_path, content, summary, risk_score"
+
+def normalize_query(query):
+    """Case, whitespace and trailing punctuation don't change what's being asked."""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!. ").lower()
+
+def search_local_index(query_vector, project_id):
+    """Matches from the local vector index, or None when it isn't synced to the project's commit."""
+    return search_vector_index(project_id, get_project_graph(project_id).last_commit, query_vector, MATCH_COUNT, MATCH_THRESHOLD)
+
+def order_matches(matches, rows):
+    """Unit rows in match order, carrying the similarity like the RPC does."""
+    by_name = {row['unit_name']: row for row in rows}
+    return [{**by_name[name], "similarity": score} for name, score in matches if name in by_name]
+
+async def aget_query_embedding(query):
+    key = normalize_query(query)
+    vector = query_embedding_cache.get(key)
+    if vector is None:
+        vector = await aget_embedding(query)
+        query_embedding_cache.set(key, vector)
+    return vector
+
+async def aget_relevant_context(query, project_id):
     try:
-        query_vector = get_embedding(query)
+        query_vector = await aget_query_embedding(query)
+        matches = await asyncio.to_thread(search_local_index, query_vector, project_id)
+        if matches is not None:
+            return order_matches(matches, await aget_unit_rows([name for name, _ in matches], project_id, CONTEXT_COLUMNS))
+
         params = {
             "query_embedding": query_vector,
-            "match_threshold": 0.2,
-            "match_count": 8,
+            "match_threshold": MATCH_THRESHOLD,
+            "match_count": MATCH_COUNT,
             "filter_project_id": project_id
         }
-        # Assuming your RPC returns columns: unit_name, content, summary, risk_score
-        response = supabase.rpc("match_memory_units", params).execute()
-        return response.data if response.data else []
+        return await amatch_memory_units(params)
     except Exception as e:
-        print(f"!!! Error in get_relevant_context: {e}")
+        print(f"!!! Error in aget_relevant_context: {e}")
         return []
 
 def get_graph_relationships(unit_name, project_id):
-    """Traces dependencies using the unit_name string."""
+    """Traces dependencies using the unit_name string, from the cached project graph."""
     try:
-        calls = supabase.table("graph_edges").select("target_unit_name")\
-            .eq("project_id", project_id).eq("source_unit_name", unit_name).execute()
-        
-        called_by = supabase.table("graph_edges").select("source_unit_name")\
-            .eq("project_id", project_id).eq("target_unit_name", unit_name).execute()
-        
-        targets = [item['target_unit_name'] for item in (calls.data or [])]
-        sources = [item['source_unit_name'] for item in (called_by.data or [])]
-        return targets, sources
+        graph = get_project_graph(project_id)
+        return graph.dependencies(unit_name), graph.callers(unit_name)
     except Exception as e:
         print(f"!!! Error in get_graph_relationships: {e}")
         return [], []
 
-def get_unit_source_code(unit_name, project_id):
-    """Fetches raw code using unit_name (the unique text key)."""
-    try:
-        # Fixed: Querying by unit_name instead of id (which is a UUID)
-        res = supabase.table("memory_units").select("content")\
-            .eq("project_id", project_id).eq("unit_name", unit_name).maybe_single().execute()
-        return res.data['content'] if (res.data and 'content' in res.data) else None
-    except Exception:
-        return None
+SYSTEM_PROMPT = (
+    "You are the Lumis Intelligence Digital Twin. You are a senior software architect with a cynical, investigative eye. "
+    "Your goal is to move beyond simple code summaries and provide deep, non-obvious architectural insights.\n\n"
+    "STRICT RESPONSE RULES:\n"
+    "1. NO FLUFF: Skip greetings like 'Hello' or 'Based on the context'. Dive straight into the technical soul of the problem.\n"
+    "2. CHAIN REACTION: If a user asks about a function, explain how changing it might break its inbound callers or its outbound dependencies.\n"
+    "3. LOGICAL CRITIQUE: Point out technical debt, race conditions, or scaling issues you see in the provided source code.\n"
+    "4. CONNECT DOTS: Use the graph relationships to infer system behavior even where code is missing.\n"
+    "5. NO TEMPLATES: Never use phrases like 'It is important to note'. Be direct and high-density."
+)
 
-def ask_twin_supabase(query, project_id):
-    try:
-        relevant_units = get_relevant_context(query, project_id)
-        active_risks = get_project_risks(project_id) or []
-        
-        if not relevant_units and not active_risks:
-            return "I couldn't find any relevant code context for this query."
-        
-        full_context = "### CODEBASE KNOWLEDGE GRAPH & SOURCE\n"
+def plan_primary_dependencies(graph, relevant_units):
+    """
+    Resolves each unit's primary dependency from the cached graph. Returns
+    {unit_name: (target, dep_id)} and the dep ids whose code still has to be fetched.
+    """
+    known_code = {u.get('unit_name'): u.get('content') for u in relevant_units}
+    primary_deps = {}
+    for unit in relevant_units:
+        name = unit.get('unit_name') or "unknown_unit"
+        for t in graph.dependencies(name)[:1]:
+            primary_deps[name] = (t, graph.resolve(t, unit.get('file_path')))
+    missing = [dep_id for _, dep_id in primary_deps.values() if dep_id and not known_code.get(dep_id)]
+    return primary_deps, missing
+
+def build_project_context(graph, relevant_units, active_risks, primary_deps, dep_code):
+    """Pure prompt assembly; every lookup has already been done by the caller."""
+    full_context = "### CODEBASE KNOWLEDGE GRAPH & SOURCE\n"
+    dep_code = {**dep_code, **{u.get('unit_name'): u.get('content') for u in relevant_units}}
         
-        for unit in relevant_units:
-            # SCHEMA FIX: Mapping keys to your specific table columns
-            name = unit.get('unit_name') or "unknown_unit" 
-            summary = unit.get('summary') or "No summary available."
-            code = unit.get('content') or "# Source code missing"
-            risk_score = unit.get('risk_score', 0)
-            file_path = unit.get('file_path', 'unknown_file')
+    for unit in relevant_units:
+        # SCHEMA FIX: Mapping keys to your specific table columns
+        name = unit.get('unit_name') or "unknown_unit" 
+        summary = unit.get('summary') or "No summary available."
+        code = unit.get('content') or "# Source code missing"
+        risk_score = unit.get('risk_score', 0)
+        file_path = unit.get('file_path', 'unknown_file')
             
-            targets, sources = get_graph_relationships(name, project_id)
+        targets, sources = graph.dependencies(name), graph.callers(name)
             
-            full_context += f"--- UNIT: {name} (File: {file_path}) ---\n"
-            if risk_score and risk_score > 60:
-                full_context += f"[CRITICAL RISK SCORE: {risk_score}/100]\n"
+        full_context += f"--- UNIT: {name} (File: {file_path}) ---\n"
+        if risk_score and risk_score > 60:
+            full_context += f"[CRITICAL RISK SCORE: {risk_score}/100]\n"
             
-            full_context += f"PURPOSE: {summary}\n"
-            full_context += f"IMPLEMENTATION:\n{code[:1200]}\n"
+        full_context += f"PURPOSE: {summary}\n"
+        full_context += f"IMPLEMENTATION:\n{code[:1200]}\n"
             
-            if sources:
-                full_context += f"CALLERS: {', '.join(sources)}\n"
-            if targets:
-                full_context += f"DEPENDENCIES: {', '.join(targets)}\n"
-                # Deep Vision for the primary dependency
-                for t in targets[:1]:
-                    dep_code = get_unit_source_code(t, project_id)
-                    if dep_code:
-                        full_context += f"  -> Implementation of {t}:\n{dep_code[:400]}...\n"
-            full_context += "\n"
-
-        if active_risks:
-            full_context += "\n### SYSTEMIC ARCHITECTURAL RISKS\n"
-            for r in active_risks:
-                full_context += f"- [{r.get('severity', 'LOW').upper()}] {r.get('risk_type')}: {r.get('description')}\n"
-
-        system_prompt = (
-            "You are the Lumis Intelligence Digital Twin. You are a senior software architect with a cynical, investigative eye. "
-            "Your goal is to move beyond simple code summaries and provide deep, non-obvious architectural insights.\n\n"
-            "STRICT RESPONSE RULES:\n"
-            "1. NO FLUFF: Skip greetings like 'Hello' or 'Based on the context'. Dive straight into the technical soul of the problem.\n"
-            "2. CHAIN REACTION: If a user asks about a function, explain how changing it might break its inbound callers or its outbound dependencies.\n"
-            "3. LOGICAL CRITIQUE: Point out technical debt, race conditions, or scaling issues you see in the provided source code.\n"
-            "4. CONNECT DOTS: Use the graph relationships to infer system behavior even where code is missing.\n"
-            "5. NO TEMPLATES: Never use phrases like 'It is important to note'. Be direct and high-density."
-        )
-        
-        user_prompt = f"PROJECT CONTEXT:\n{full_context}\n\nUSER QUERY: {query}"
-        
-        return get_llm_completion(system_prompt, user_prompt)
+        if sources:
+            full_context += f"CALLERS: {', '.join(sources)}\n"
+        if targets:
+            full_context += f"DEPENDENCIES: {', '.join(targets)}\n"
+            # Deep Vision for the primary dependency
+            t, dep_id = primary_deps.get(name, (None, None))
+            if dep_code.get(dep_id):
+                full_context += f"  -> Implementation of {t}:\n{dep_code[dep_id][:400]}...\n"
+        full_context += "\n"
+
+    if active_risks:
+        full_context += "\n### SYSTEMIC ARCHITECTURAL RISKS\n"
+        for r in active_risks:
+            full_context += f"- [{r.get('severity', 'LOW').upper()}] {r.get('risk_type')}: {r.get('description')}\n"
+    return full_context
+
+def describe_units(relevant_units):
+    """The retrieved units as sent to the dashboard ahead of the answer."""
+    return [
+        {
+            "unit_name": unit.get('unit_name'),
+            "file_path": unit.get('file_path'),
+            "summary": unit.get('summary'),
+            "risk_score": unit.get('risk_score', 0),
+        }
+        for unit in relevant_units
+    ]
+
+def _lookup_cached_answer(graph, query, project_id):
+    # Answers are reused until the project's commit changes
+    cache_key = (project_id, graph.last_commit, normalize_query(query))
+    cached = answer_cache.get(cache_key)
+    if cached is not None:
+        return cache_key, {"cache_key": cache_key, "cached": True, "answer": cached["answer"], "units": cached["units"]}
+    return cache_key, None
+
+def _new_chat(cache_key, relevant_units, active_risks):
+    chat = {"cache_key": cache_key, "cached": False, "answer": None, "units": describe_units(relevant_units)}
+    if not relevant_units and not active_risks:
+        chat["answer"] = "I couldn't find any relevant code context for this query."
+    return chat
+
+async def aprepare_chat(query, project_id):
+    """
+    Retrieval and prompt assembly shared by the JSON and streaming endpoints.
+    `answer` is set when no LLM call is needed (cached or nothing to go on).
+    DB and embedding calls don't hold the event loop, and the vector search
+    and risk lookup run concurrently.
+    """
+    graph = await asyncio.to_thread(get_project_graph, project_id)
+    cache_key, cached = _lookup_cached_answer(graph, query, project_id)
+    if cached is not None:
+        return cached
+
+    relevant_units, active_risks = await asyncio.gather(
+        aget_relevant_context(query, project_id),
+        aget_project_risks(project_id)
+    )
+    active_risks = active_risks or []
+    chat = _new_chat(cache_key, relevant_units, active_risks)
+    if chat["answer"] is not None:
+        return chat
+
+    primary_deps, missing = plan_primary_dependencies(graph, relevant_units)
+    dep_code = {}
+    if missing:
+        try:
+            dep_code = await aget_unit_source_codes(missing, project_id)
+        except Exception as e:
+            print(f"!!! Error in aget_unit_source_codes: {e}")
+    full_context = build_project_context(graph, relevant_units, active_risks, primary_deps, dep_code)
+    chat["user_prompt"] = f"PROJECT CONTEXT:\n{full_context}\n\nUSER QUERY: {query}"
+    return chat
+
+async def aask_twin_supabase(query, project_id):
+    try:
+        with span("chat_stage_seconds", stage="retrieve"):
+            chat = await aprepare_chat(query, project_id)
+        if chat["answer"] is not None:
+            return chat["answer"]
+
+        with span("chat_stage_seconds", stage="generate"):
+            answer = await aget_llm_completion(SYSTEM_PROMPT, chat["user_prompt"])
+        if answer:
+            answer_cache.set(chat["cache_key"], {"answer": answer, "units": chat["units"]})
+        return answer
 
     except Exception as e:
         print("--- CHAT EXECUTION FAILED ---")
         print(traceback.format_exc())
-        return f"Internal Error: {str(e)}"
\ No newline at end of file
+        return f"Internal Error: {str(e)}"
+
+async def astream_twin_supabase(query, project_id):
+    """
+    Yields (event, data) pairs for server-sent events: `context` with the retrieved
+    units as soon as retrieval finishes, `token` per chunk of the answer, then `done`.
+    Failures end the stream with an `error` event.
+    """
+    try:
+        with span("chat_stage_seconds", stage="retrieve"):
+            chat = await aprepare_chat(query, project_id)
+        yield "context", {"units": chat["units"], "cached": chat["cached"]}
+
+        if chat["answer"] is not None:
+            yield "token", {"text": chat["answer"]}
+            yield "done", {}
+            return
+
+        parts = []
+        # Generation spans the whole stream, including time the client takes to read it
+        with span("chat_stage_seconds", stage="generate_stream"):
+            async for text in astream_llm_completion(SYSTEM_PROMPT, chat["user_prompt"]):
+                parts.append(text)
+                yield "token", {"text": text}
+
+        answer = "".join(parts).strip()
+        if answer:
+            answer_cache.set(chat["cache_key"], {"answer": answer, "units": chat["units"]})
+        yield "done", {}
+
+    except Exception as e:
+        print("--- CHAT STREAM FAILED ---")
+        print(traceback.format_exc())
+        yield "error", {"message": str(e)}
+
+def ask_twin_supabase(query, project_id):
+    """Blocking entry point for scripts and benchmarks; runs aask_twin_supabase to completion."""
+    return run_sync(aask_twin_supabase(query, project_id))
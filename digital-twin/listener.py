@@ -1,11 +1,30 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException, Request
+import os
+import json
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from src.db_client import supabase, get_project_risks  # <--- UPDATED IMPORT
-from main import run_ingestion_for_user
-from chat import ask_twin_supabase
-
-app = FastAPI(title="Digital Twin API")
+from src.async_db import acreate_project, aget_project_risks, aget_user_project
+from main import run_ingestion_for_user, run_incremental_sync, is_deleted_ref_push
+from chat import aask_twin_supabase, astream_twin_supabase
+from src.cache import get_cache_stats
+from src.job_scheduler import ingest_scheduler, PRIORITY_INTERACTIVE, PRIORITY_WEBHOOK
+from src.progress import progress_hub
+from src.metrics import render_metrics, profiled
+from src.services import warmup
+
+# Load the embedding model in the background at startup so the server accepts requests at once
+SERVICES_WARMUP = os.getenv("SERVICES_WARMUP", "1") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if SERVICES_WARMUP:
+        threading.Thread(target=warmup, name="warmup", daemon=True).start()
+    yield
+
+app = FastAPI(title="Digital Twin API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -14,64 +33,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global store for ingestion status
-ingestion_status = {}
-
 # Pydantic models for automatic validation
 class IngestRequest(BaseModel):
     user_id: str
     repo_url: str
+    # Writes a cProfile of this run to PROFILE_DIR
+    profile: bool = False
 
 class ChatRequest(BaseModel):
     query: str
     project_id: str
 
-def update_progress(project_id: str, step: str, log_message: str = None, error: str = None):
-    if project_id not in ingestion_status:
-        ingestion_status[project_id] = {"status": "IDLE", "logs": []}
-    
-    state = ingestion_status[project_id]
-    state["step"] = step
-    if log_message:
-        state["logs"].append(log_message)
-    
-    if error:
-        state["status"] = "Error"
-        state["error"] = str(error)
-    elif step == "DONE":
-        state["status"] = "DONE"
-    elif step == "STARTING":
-        state["status"] = "STARTING"
-    else:
-        state["status"] = "PROCESSING"
+def update_progress(project_id: str, step: str, log_message: str = None, error: str = None, progress: dict = None):
+    progress_hub.update(project_id, step, log_message, error, progress)
 
 @app.get("/api/ingest/status/{project_id}")
-async def get_status(project_id: str):
-    status = ingestion_status.get(project_id)
+async def get_status(project_id: str, since: int = 0):
+    """Polling fallback for the events stream. `since` skips log lines the client already has."""
+    status = progress_hub.snapshot(project_id, since)
     if not status:
         return {"status": "IDLE"}
     
-    current_status_val = status.get("status")
-    
-    # If the status is DONE, we grab the data to return it, 
+    # If the status is DONE, we return it once, 
     # then IMMEDIATELY reset it to IDLE for the next call.
-    if current_status_val == "DONE":
-        response = status.copy()
-        ingestion_status[project_id] = {"status": "IDLE", "logs": []}
+    if status["status"] == "DONE":
+        progress_hub.reset_if_done(project_id)
         print(f"Status for {project_id} reset to IDLE after DONE check.")
-        return response
         
     return status
 
+@app.get("/api/ingest/events/{project_id}")
+async def ingest_events(project_id: str, since: int = 0):
+    """Server-sent `progress` events for an ingestion, throttled; the stream ends after DONE or Error."""
+    async def event_stream():
+        async for snapshot in progress_hub.subscribe(project_id, since):
+            if snapshot is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: progress\ndata: {json.dumps(snapshot)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/ingest")
-async def start_ingest(req: IngestRequest, background_tasks: BackgroundTasks):
+async def start_ingest(req: IngestRequest):
     try:
         # Create Project in DB
-        project = supabase.table("projects").insert({
-            "user_id": req.user_id, 
-            "repo_url": req.repo_url,
-            "last_commit": "pending"
-        }).execute()
+        project = await acreate_project(req.user_id, req.repo_url)
         
         if not project.data:
             raise Exception("Failed to create project in database.")
@@ -79,20 +90,19 @@ async def start_ingest(req: IngestRequest, background_tasks: BackgroundTasks):
         project_id = project.data[0]['id']
         
         # Initialize Status
-        ingestion_status[project_id] = {
-            "status": "starting", 
-            "step": "Initializing...", 
-            "logs": ["Request received."],
-            "error": None
-        }
+        progress_hub.start(project_id, "starting", "Initializing...", "Request received.")
         
-        # FastAPI's BackgroundTasks handles the thread management for you
-        background_tasks.add_task(
-            run_ingestion_for_user, 
-            req.repo_url, 
-            req.user_id, 
-            project_id, 
-            lambda s, l=None, e=None: update_progress(project_id, s, l, e)
+        run = run_ingestion_for_user
+        if req.profile:
+            run = profiled(run_ingestion_for_user, f"ingest-{project_id}")
+
+        # First-time ingests jump ahead of queued webhook re-syncs
+        ingest_scheduler.submit(
+            project_id,
+            run,
+            (req.repo_url, req.user_id, project_id),
+            lambda s, l=None, e=None, p=None: update_progress(project_id, s, l, e, p),
+            priority=PRIORITY_INTERACTIVE
         )
         
         return {"project_id": project_id}
@@ -103,7 +113,7 @@ async def start_ingest(req: IngestRequest, background_tasks: BackgroundTasks):
 @app.get("/api/risks/{project_id}")
 async def get_risks(project_id: str):
     try:
-        risks = get_project_risks(project_id)
+        risks = await aget_project_risks(project_id)
         return {"status": "success", "risks": risks}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -111,25 +121,45 @@ async def get_risks(project_id: str):
 @app.post("/api/chat")
 async def chat(req: ChatRequest):
     try:
-        response = ask_twin_supabase(req.query, req.project_id)
+        response = await aask_twin_supabase(req.query, req.project_id)
         return {"response": response}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """Server-sent events variant of /api/chat: context units first, then answer tokens."""
+    async def event_stream():
+        async for event, data in astream_twin_supabase(req.query, req.project_id):
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/chat/cache-stats")
+async def chat_cache_stats():
+    return get_cache_stats()
+
+@app.get("/api/ingest/queue")
+async def ingest_queue():
+    return ingest_scheduler.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape target. Each uvicorn worker reports its own process."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.post("/api/webhook/{user_id}/{project_id}")
-async def github_webhook(user_id: str, project_id: str, request: Request, background_tasks: BackgroundTasks):
+async def github_webhook(user_id: str, project_id: str, request: Request):
     try:
         # 1. Fetch project safely using Python-style snake_case
-        # Use maybe_single() to avoid crashing if the ID is wrong
-        res = supabase.table("projects") \
-            .select("*") \
-            .eq("id", project_id) \
-            .eq("user_id", user_id) \
-            .maybe_single() \
-            .execute()
+        project = await aget_user_project(user_id, project_id)
 
         # Handle missing project (common if DB was truncated)
-        if not res or not res.data:
+        if not project:
             print(f"Webhook Ignored: Project {project_id} not found for user {user_id}")
             return {"status": "ignored", "reason": "project_not_found"}
 
@@ -144,6 +174,14 @@ async def github_webhook(user_id: str, project_id: str, request: Request, backgr
         ref = payload.get("ref", "")
         # Only trigger for pushes to branches (ignore tags/deletions)
         if "refs/heads/" in ref:
+            if payload.get("deleted") or is_deleted_ref_push(payload.get("after")):
+                return {"status": "ignored", "reason": "branch_deleted"}
+
+            # The twin follows the default branch, which is what a full ingestion clones
+            default_branch = payload.get("repository", {}).get("default_branch")
+            if default_branch and ref != f"refs/heads/{default_branch}":
+                return {"status": "ignored", "reason": "not_default_branch", "ref": ref}
+
             new_sha = payload.get("after")
             repo_url = payload.get("repository", {}).get("clone_url")
             
@@ -156,16 +194,20 @@ async def github_webhook(user_id: str, project_id: str, request: Request, backgr
                 f"GitHub Push detected ({new_sha[:7]}). Initializing Twin Sync..."
             )
 
-            # 4. Fire and forget: Run the full ingestion in the background
-            background_tasks.add_task(
-                run_ingestion_for_user,
-                repo_url,
-                user_id,
+            # 4. Queue the sync: only what the push changed (falls back to a full ingestion).
+            # Pushes arriving while one is queued collapse into the newest SHA.
+            outcome = ingest_scheduler.submit(
                 project_id,
-                lambda s, l=None, e=None: update_progress(project_id, s, l, e)
+                run_incremental_sync,
+                (repo_url, user_id, project_id, payload.get("before"), new_sha, ref),
+                lambda s, l=None, e=None, p=None: update_progress(project_id, s, l, e, p),
+                priority=PRIORITY_WEBHOOK,
+                key=new_sha
             )
+            if outcome == "duplicate":
+                return {"status": "ignored", "reason": "already_queued", "commit": new_sha}
 
-            return {"status": "sync_started", "commit": new_sha}
+            return {"status": "sync_started", "commit": new_sha, "queue": outcome}
 
         return {"status": "ignored", "reason": "not_a_push_event"}
 
@@ -3,20 +3,212 @@ import shutil
 import stat
 import time
 import gc
+from contextlib import contextmanager
 from git import Repo
+from git.exc import BadName, GitCommandError
 from dotenv import load_dotenv
 from typing import get_args
 import tree_sitter_language_pack as tree
 from src.risk_engine import calculate_predictive_risks
-from src.ingestor import get_code_data, enrich_block, get_git_metadata
-from src.services import generate_footprint
-from src.db_client import supabase, save_memory_unit, save_edges
+from src.graph_cache import invalidate_project_graph
+from src.cache import invalidate_project_answers
+from src.ingestor import enrich_blocks
+from src.parse_pool import iter_parsed_files
+from src.parser import read_unit_code
+from src.history import build_history_index, HISTORY_WINDOW_DAYS
+from src.job_scheduler import JobCancelled
+from src.vector_index import begin_index_update, finish_index_update
+from src.metrics import StageTimer, increment, span
+from src.db_client import supabase, save_memory_unit, sync_edges, get_unit_footprints, delete_units
 
 load_dotenv()
 
+# Changed units are enriched (summary + batched embedding) in groups of this size
+ENRICH_FLUSH_SIZE = int(os.getenv("ENRICH_FLUSH_SIZE", "256"))
+
+IGNORE_EXT = ('.png', '.jpg', '.jpeg', '.gif', '.exe', '.dll', '.pyc', '.o', '.obj',
+              '.css', '.svg', '.md', '.gitignore', '.csv', '.json', '.yaml', '.yml')
+SKIP_DIRS = {'.git', '.github', 'node_modules', 'venv', '__pycache__', 'dist', 'build'}
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, so run a single worker there
+    fcntl = None
+
+def get_workspace_path(user_id, project_id):
+    """The working copy is kept between syncs so webhooks can fetch incrementally."""
+    return os.path.join("temp_projects", str(user_id), str(project_id))
+
+@contextmanager
+def workspace_lock(user_project_path, status_callback):
+    """
+    Holds an exclusive flock on `<workspace>.lock` so ingestions of one project in
+    different uvicorn workers (each with its own scheduler) run one after another
+    instead of wiping each other's working copy.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(user_project_path), exist_ok=True)
+    with open(f"{user_project_path}.lock", "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            status_callback("STARTING", "Waiting for another sync of this project to finish...")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def get_supported_languages():
+    raw_args = get_args(tree.SupportedLanguage)
+    return list(raw_args[0].__args__ if raw_args and hasattr(raw_args[0], '__args__') else raw_args)
+
+def is_source_path(rel_path):
+    parts = rel_path.replace("\\", "/").split("/")
+    if any(part in SKIP_DIRS for part in parts[:-1]):
+        return False
+    return not parts[-1].lower().endswith(IGNORE_EXT)
+
+def list_source_files(repo_path):
+    rel_paths = []
+    for root, dirs, files in os.walk(repo_path):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for f in files:
+            if f.lower().endswith(IGNORE_EXT): continue
+            rel_paths.append(os.path.relpath(os.path.join(root, f), repo_path))
+    return rel_paths
+
+def units_in_files(unit_names, rel_paths):
+    """Picks the `file::name` ids that belong to any of the given files."""
+    prefixes = tuple(f"{path}::" for path in rel_paths)
+    return [name for name in unit_names if prefixes and name.startswith(prefixes)]
+
+def clone_repository(repo_url, repo_path):
+    """Clones only the history the legacy window needs, or just the tip if the window has no commits."""
+    try:
+        repo = Repo.clone_from(repo_url, repo_path, shallow_since=f"{HISTORY_WINDOW_DAYS} days ago")
+        # One extra commit gives the oldest in-window commits a parent to diff against
+        repo.git.fetch("--deepen=1")
+        return repo
+    except GitCommandError as e:
+        print(f"Shallow-since clone failed, falling back to depth=1: {e}")
+        if os.path.exists(repo_path):
+            shutil.rmtree(repo_path, ignore_errors=True)
+        return Repo.clone_from(repo_url, repo_path, depth=1)
+
+def process_files(project_id, history, repo_path, rel_paths, languages, known_footprints, status_callback, vector_index=None):
+    """
+    Parses the given files and enriches units whose footprint changed. Enriched units
+    are also written to `vector_index` when ingestion is updating it in place.
+    Returns the scanned unit ids and the set of (source, target) call edges they produce.
+    """
+    pending_units = []
+    scanned_units = set()
+    edges = set()
+    # Structured counters replace a log line per file; the progress channel throttles them
+    progress = {"files_done": 0, "files_total": len(rel_paths), "units_scanned": 0, "units_enriched": 0}
+
+    def flush_pending_units():
+        status_callback("PROCESSING", f"Enriching {len(pending_units)} changed units...")
+        # Parsing time is what remains of the process_files stage after these two
+        with span("ingest_enrich_seconds"):
+            intel_list = enrich_blocks([(p["content"], p["unit_name"]) for p in pending_units])
+        with span("ingest_save_seconds"):
+            for unit_payload, intel in zip(pending_units, intel_list):
+                if intel:
+                    save_memory_unit(project_id, {**unit_payload, **intel})
+        if vector_index is not None:
+            saved = [(p["id"], intel["embedding"]) for p, intel in zip(pending_units, intel_list) if intel]
+            if saved:
+                vector_index.upsert([name for name, _ in saved], [vector for _, vector in saved])
+        progress["units_enriched"] += len(pending_units)
+        pending_units.clear()
+        status_callback("PROCESSING", None, None, dict(progress))
+
+    # Workers return compact records; bodies are only decoded for units that changed
+    for rel_path, units in iter_parsed_files(repo_path, rel_paths, languages):
+        progress["files_done"] += 1
+        progress["units_scanned"] += len(units)
+        status_callback("PROCESSING", None, None, {**progress, "current_file": rel_path})
+
+        if not units: continue
+        content = None
+
+        for unit in units:
+            node_id = f"{rel_path}::{unit['name']}"
+            scanned_units.add(node_id)
+            edges.update((node_id, target) for target in unit["calls"])
+
+            # Deduplication Check
+            if known_footprints.get(node_id) != unit["footprint"]:
+                if content is None:
+                    with open(os.path.join(repo_path, rel_path), "rb") as f:
+                        content = f.read()
+                last_modified, author_email = history.lookup_unit(rel_path, unit["start_line"], unit["end_line"])
+                pending_units.append({
+                    "id": node_id,
+                    "file_path": rel_path,
+                    "unit_name": unit['name'],
+                    "content": read_unit_code(content, unit),
+                    "last_modified_at": last_modified.isoformat() if last_modified else None,
+                    "author_email": author_email
+                })
+                if len(pending_units) >= ENRICH_FLUSH_SIZE:
+                    flush_pending_units()
+
+    if pending_units:
+        flush_pending_units()
+
+    return scanned_units, edges
+
+def get_tracked_branch(repo):
+    """The branch the working copy was cloned from, i.e. the remote's default branch."""
+    try:
+        return repo.git.symbolic_ref("--short", "refs/remotes/origin/HEAD").split("/", 1)[1]
+    except GitCommandError:
+        return None
+
+def is_deleted_ref_push(after_sha):
+    """Branch deletions arrive as pushes whose `after` is all zeros."""
+    return not after_sha or set(after_sha) == {"0"}
+
+def get_changed_paths(repo, base_sha, new_sha):
+    """
+    Returns (changed, deleted) paths between two commits from `git diff --name-status`.
+    Renames count as a deletion of the old path plus a change of the new one.
+    """
+    tokens = repo.git.diff("--name-status", "-M", "-z", base_sha, new_sha).split("\0")
+    changed, deleted = set(), set()
+    i = 0
+    while i < len(tokens) and tokens[i]:
+        status = tokens[i][0]
+        if status in ("R", "C"):
+            old_path, new_path = tokens[i + 1], tokens[i + 2]
+            i += 3
+            if status == "R":
+                deleted.add(os.path.normpath(old_path))
+            changed.add(os.path.normpath(new_path))
+        else:
+            path = os.path.normpath(tokens[i + 1])
+            i += 2
+            (deleted if status == "D" else changed).add(path)
+    return changed, deleted
+
 def run_ingestion_for_user(repo_url, user_id, project_id, status_callback):
+    with workspace_lock(get_workspace_path(user_id, project_id), status_callback):
+        return _run_full_ingestion(repo_url, user_id, project_id, status_callback)
+
+def run_incremental_sync(repo_url, user_id, project_id, before_sha, after_sha, ref, status_callback):
+    with workspace_lock(get_workspace_path(user_id, project_id), status_callback):
+        return _run_incremental_sync(repo_url, user_id, project_id, before_sha, after_sha, ref, status_callback)
+
+def _run_full_ingestion(repo_url, user_id, project_id, status_callback):
+    """Clones the repository afresh and reconciles every unit; the caller holds the workspace lock."""
     repo = None
-    user_project_path = os.path.join("temp_projects", str(user_id), str(project_id))
+    user_project_path = get_workspace_path(user_id, project_id)
+    timer = StageTimer("ingest_stage_seconds", kind="full")
 
     def remove_readonly(func, path, excinfo):
         os.chmod(path, stat.S_IWRITE)
@@ -27,13 +219,17 @@ def run_ingestion_for_user(repo_url, user_id, project_id, status_callback):
         status_callback("STARTING", "Initializing environment...")
 
         # 2. SAFETY CHECK
-        check = supabase.table("projects").select("id").eq("id", project_id).execute()
+        timer.stage("prepare")
+        check = supabase.table("projects").select("id, last_commit").eq("id", project_id).execute()
         if not check.data:
+            increment("ingest_runs_total", kind="full", outcome="missing_project")
             status_callback("Error", None, "Project record missing from database.")
             return
-        
+        base_commit = check.data[0].get("last_commit")
+
         status_callback("PROCESSING", "Cleaning workspace...")
-        
+        timer.stage("clean_workspace")
+
         # Windows Lock Fix
         if os.path.exists(user_project_path):
             gc.collect()
@@ -42,87 +238,198 @@ def run_ingestion_for_user(repo_url, user_id, project_id, status_callback):
 
         # 3. CLONE
         status_callback("PROCESSING", "Cloning repository...")
-        repo = Repo.clone_from(repo_url, user_project_path, depth=1)
+        timer.stage("clone")
+        repo = clone_repository(repo_url, user_project_path)
         new_commit = repo.head.commit.hexsha
 
+        # One `git log` pass replaces a per-file history query
+        status_callback("PROCESSING", "Indexing commit history...")
+        timer.stage("index_history")
+        history = build_history_index(user_project_path)
+
         # 4. SETUP LANGUAGES
-        raw_args = get_args(tree.SupportedLanguage)
-        languages = list(raw_args[0].__args__ if raw_args and hasattr(raw_args[0], '__args__') else raw_args)
-         
-        IGNORE_EXT = ('.png', '.jpg', '.jpeg', '.gif', '.exe', '.dll', '.pyc', '.o', '.obj', 
-                      '.css', '.svg', '.md', '.gitignore', '.csv', '.json', '.yaml', '.yml')
-        SKIP_DIRS = {'.git', '.github', 'node_modules', 'venv', '__pycache__', 'dist', 'build'}
+        languages = get_supported_languages()
 
         # 5. SCAN
         status_callback("PROCESSING", "Scanning file structure...")
-        current_scan_files = [] 
-        all_valid_files = []
-        
-        for root, dirs, files in os.walk(user_project_path):
-            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
-            for f in files:
-                if f.lower().endswith(IGNORE_EXT): continue
-                all_valid_files.append(os.path.join(root, f))
+        timer.stage("scan_files")
+        current_scan_files = list_source_files(user_project_path)
 
         # 6. PROCESS UNITS
-        for f_path in all_valid_files:
-            rel_path = os.path.relpath(f_path, user_project_path)
-            current_scan_files.append(rel_path)
-            
-            status_callback("PROCESSING", f"Analyzing logic in {rel_path}...")
-            last_modified, author_email = get_git_metadata(user_project_path, f_path, repo)
-            units = get_code_data(f_path, languages)
-            
-            if not units: continue
-
-            for unit in units:
-                node_id = f"{rel_path}::{unit['name']}"
-                current_hash = generate_footprint(unit["code"])
-                
-                # Deduplication Check
-                existing = supabase.table("memory_units").select("code_footprint").eq("project_id", project_id).eq("unit_name", node_id).execute()
-
-                if not existing.data or existing.data[0]['code_footprint'] != current_hash:
-                    intel = enrich_block(unit["code"], unit["name"])
-                    if intel:
-                        unit_payload = { 
-                            "id": node_id, 
-                            "file_path": rel_path, 
-                            "unit_name": unit['name'],
-                            "content": unit['code'],   
-                            "last_modified_at": last_modified.isoformat() if last_modified else None,
-                            "author_email": author_email,
-                            **intel 
-                        }
-                        save_memory_unit(project_id, unit_payload)
-
-                save_edges(project_id, node_id, unit["calls"])
+        # Deduplication index: one paginated read instead of one query per unit
+        status_callback("PROCESSING", "Loading existing memory index...")
+        timer.stage("load_memory_index")
+        known_footprints = get_unit_footprints(project_id)
+        vector_index = begin_index_update(project_id, base_commit, bool(known_footprints))
+        timer.stage("process_files")
+        scanned_units, edges = process_files(project_id, history, user_project_path, current_scan_files, languages, known_footprints, status_callback, vector_index)
 
         # 7. CLEANUP (Differential Sync)
         status_callback("PROCESSING", "Synchronizing graph state...")
-        db_resp = supabase.table("memory_units").select("file_path").eq("project_id", project_id).execute()
-        
-        if db_resp.data:
-            db_files = set([u['file_path'] for u in db_resp.data])
-            scan_files = set(current_scan_files)
-            deleted_files = db_files - scan_files
-            for dead_file in deleted_files:
-                supabase.table("memory_units").delete().eq("project_id", project_id).eq("file_path", dead_file).execute()
+        timer.stage("sync_graph")
+        stale_units = set(known_footprints) - scanned_units
+        removed_units, removed_unit_edges = delete_units(project_id, stale_units)
+        if vector_index is not None:
+            vector_index.delete(stale_units)
+        status_callback("PROCESSING", f"Removed {removed_units} stale units and {removed_unit_edges} of their edges.")
+
+        added_edges, removed_edges = sync_edges(project_id, edges)
+        status_callback("PROCESSING", f"Dependency graph: {added_edges} edges added, {removed_edges} removed.")
 
         # 8. FINALIZE RISKS
         supabase.table("projects").update({"last_commit": new_commit}).eq("id", project_id).execute()
-        
+
         status_callback("PROCESSING", "Calculating predictive risks...")
+        timer.stage("calculate_risks")
         risk_count = calculate_predictive_risks(project_id)
-        
+
         # 9. THE FINAL SIGNAL
+        timer.stage("finalize")
+        finish_index_update(project_id, vector_index, new_commit)
+        invalidate_project_graph(project_id)
+        invalidate_project_answers(project_id)
+        timer.end()
+        increment("ingest_runs_total", kind="full", outcome="done")
         status_callback("DONE", f"Success! {risk_count} risks identified in commit {new_commit[:7]}.")
 
+    except JobCancelled as e:
+        # A newer push for this project is queued and will report its own progress
+        print(f"Ingestion Superseded: {e}")
+        increment("ingest_runs_total", kind="full", outcome="superseded")
     except Exception as e:
         print(f"Ingestion Failed: {e}")
+        increment("ingest_runs_total", kind="full", outcome="error")
+        status_callback("Error", None, str(e))
+    finally:
+        timer.end()
+        if timer.durations:
+            print(f"Ingestion timings for {project_id}: {timer.summary()}")
+        if repo:
+            repo.close()
+            del repo
+        gc.collect()
+
+def _run_incremental_sync(repo_url, user_id, project_id, before_sha, after_sha, ref, status_callback):
+    """
+    Re-ingests only the files a push touched, diffing the project's last synced commit
+    against `after_sha` in the persistent working copy. Falls back to a full ingestion
+    when there is no usable working copy or base commit. Pushes to any branch other
+    than the one the working copy tracks are ignored, like branch deletions.
+    The caller holds the workspace lock.
+    """
+    repo = None
+    user_project_path = get_workspace_path(user_id, project_id)
+    timer = StageTimer("ingest_stage_seconds", kind="incremental")
+
+    try:
+        # 1. IMMEDIATE START SIGNAL
+        status_callback("STARTING", "Preparing incremental sync...")
+
+        # 2. SAFETY CHECK
+        timer.stage("prepare")
+        check = supabase.table("projects").select("id, last_commit").eq("id", project_id).execute()
+        if not check.data:
+            increment("ingest_runs_total", kind="incremental", outcome="missing_project")
+            status_callback("Error", None, "Project record missing from database.")
+            return
+        base_sha = check.data[0].get("last_commit")
+
+        # 3. REUSE WORKING COPY
+        if base_sha and os.path.isdir(os.path.join(user_project_path, ".git")):
+            repo = Repo(user_project_path)
+            try:
+                repo.commit(base_sha)
+            except (BadName, ValueError):
+                repo.close()
+                repo = None
+
+        if repo is None:
+            status_callback("PROCESSING", "No synced working copy found, falling back to full ingestion...")
+            increment("ingest_runs_total", kind="incremental", outcome="fallback")
+            timer.end()
+            return _run_full_ingestion(repo_url, user_id, project_id, status_callback)
+
+        # Full ingestion clones the default branch; syncing any other ref would flip the twin between branches
+        tracked_branch = get_tracked_branch(repo)
+        if is_deleted_ref_push(after_sha):
+            reason = f"{ref} was deleted"
+        elif tracked_branch and ref != f"refs/heads/{tracked_branch}":
+            reason = f"the twin follows {tracked_branch}"
+        else:
+            reason = None
+        if reason:
+            print(f"Incremental sync for {project_id} ignored push to {ref}: {reason}")
+            increment("ingest_runs_total", kind="incremental", outcome="ignored")
+            status_callback("DONE", f"Push to {ref} ignored; {reason}.")
+            return
+
+        if before_sha and before_sha != base_sha:
+            print(f"Incremental sync for {project_id} catching up from {base_sha[:7]} (push base {before_sha[:7]})")
+
+        status_callback("PROCESSING", f"Fetching {ref}...")
+        timer.stage("fetch")
+        repo.remotes.origin.fetch(ref)
+        repo.git.checkout("--force", after_sha)
+
+        # 4. DIFF
+        timer.stage("diff")
+        changed, deleted = get_changed_paths(repo, base_sha, after_sha)
+        changed = sorted(p for p in changed if is_source_path(p) and os.path.isfile(os.path.join(user_project_path, p)))
+        deleted = sorted(p for p in deleted if is_source_path(p))
+        status_callback("PROCESSING", f"Push touched {len(changed)} changed and {len(deleted)} removed files.")
+
+        # 5. PROCESS CHANGED FILES
+        timer.stage("index_history")
+        history = build_history_index(user_project_path)
+        timer.stage("load_memory_index")
+        known_footprints = get_unit_footprints(project_id)
+        vector_index = begin_index_update(project_id, base_sha, bool(known_footprints))
+        timer.stage("process_files")
+        scanned_units, edges = process_files(project_id, history, user_project_path, changed, get_supported_languages(), known_footprints, status_callback, vector_index)
+
+        # 6. TARGETED REMOVALS
+        # Units of deleted files, plus units removed or renamed inside changed files
+        status_callback("PROCESSING", "Synchronizing graph state...")
+        timer.stage("sync_graph")
+        stale_units = set(units_in_files(known_footprints, changed + deleted)) - scanned_units
+        removed_units, removed_unit_edges = delete_units(project_id, stale_units)
+        if vector_index is not None:
+            vector_index.delete(stale_units)
+        status_callback("PROCESSING", f"Removed {removed_units} stale units and {removed_unit_edges} of their edges.")
+
+        # Only edges leaving units of the changed files can differ
+        added_edges, removed_edges = sync_edges(project_id, edges, sources=scanned_units)
+        status_callback("PROCESSING", f"Dependency graph: {added_edges} edges added, {removed_edges} removed.")
+
+        # 7. FINALIZE RISKS
+        supabase.table("projects").update({"last_commit": after_sha}).eq("id", project_id).execute()
+
+        status_callback("PROCESSING", "Calculating predictive risks...")
+        timer.stage("calculate_risks")
+        risk_count = calculate_predictive_risks(project_id)
+
+        # 8. THE FINAL SIGNAL
+        timer.stage("finalize")
+        finish_index_update(project_id, vector_index, after_sha)
+        invalidate_project_graph(project_id)
+        invalidate_project_answers(project_id)
+        timer.end()
+        increment("ingest_runs_total", kind="incremental", outcome="done")
+        status_callback("DONE", f"Success! {risk_count} risks identified in commit {after_sha[:7]}.")
+
+    except JobCancelled as e:
+        # A newer push for this project is queued and will report its own progress
+        print(f"Incremental Sync Superseded: {e}")
+        increment("ingest_runs_total", kind="incremental", outcome="superseded")
+    except Exception as e:
+        print(f"Incremental Sync Failed: {e}")
+        increment("ingest_runs_total", kind="incremental", outcome="error")
         status_callback("Error", None, str(e))
     finally:
+        timer.end()
+        if timer.durations:
+            print(f"Incremental sync timings for {project_id}: {timer.summary()}")
         if repo:
             repo.close()
             del repo
-        gc.collect()
\ No newline at end of file
+        gc.collect()
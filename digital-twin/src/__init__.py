@@ -1 +1,6 @@
-from .ingestor import get_code_data, enrich_block
\ No newline at end of file
+# Resolved lazily so light modules (e.g. parse workers importing src.parser) skip the model and DB setup
+def __getattr__(name):
+    if name in ("get_code_data", "enrich_block"):
+        from . import ingestor
+        return getattr(ingestor, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,76 @@
+import os
+import asyncio
+import httpx
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
+from dotenv import load_dotenv
+from src.db_client import chunked, db_target, DB_TIMEOUT
+from src.metrics import http_metric_hooks
+from src.async_services import HTTP_LIMITS
+
+load_dotenv()
+
+url: str = os.environ.get("SUPABASE_URL")
+key: str = os.environ.get("SUPABASE_KEY")
+
+# Async twin of db_client for the request path. Ingestion keeps the sync client.
+_async_supabase: AsyncClient = None
+_client_lock = asyncio.Lock()
+
+async def get_async_supabase():
+    """Creates the client on first use so it is bound to the server's event loop."""
+    global _async_supabase
+    if _async_supabase is None:
+        async with _client_lock:
+            if _async_supabase is None:
+                options = AsyncClientOptions(httpx_client=httpx.AsyncClient(
+                    limits=HTTP_LIMITS,
+                    timeout=DB_TIMEOUT,
+                    event_hooks=http_metric_hooks("db", db_target, asynchronous=True, client="async"),
+                ))
+                _async_supabase = await acreate_client(url, key, options=options)
+    return _async_supabase
+
+async def aget_project_risks(project_id):
+    """Fetches active risk alerts for the project."""
+    db = await get_async_supabase()
+    response = await db.table("project_risks").select("*").eq("project_id", project_id).order("created_at", desc=True).limit(10).execute()
+    return response.data
+
+async def amatch_memory_units(params):
+    db = await get_async_supabase()
+    response = await db.rpc("match_memory_units", params).execute()
+    return response.data if response.data else []
+
+async def aget_unit_rows(unit_names, project_id, columns="unit_name, file_path, content, summary, risk_score"):
+    """Fetches many units (by unit_name); chunks are requested concurrently."""
+    db = await get_async_supabase()
+    responses = await asyncio.gather(*[
+        db.table("memory_units").select(columns)
+            .eq("project_id", project_id).in_("unit_name", chunk).execute()
+        for chunk in chunked(sorted(set(unit_names)))
+    ])
+    return [row for res in responses for row in (res.data or [])]
+
+async def aget_unit_source_codes(unit_names, project_id):
+    """Fetches raw code for many units (by unit_name)."""
+    rows = await aget_unit_rows(unit_names, project_id, "unit_name, content")
+    return {row['unit_name']: row.get('content') for row in rows}
+
+async def acreate_project(user_id, repo_url):
+    db = await get_async_supabase()
+    return await db.table("projects").insert({
+        "user_id": user_id,
+        "repo_url": repo_url,
+        "last_commit": "pending"
+    }).execute()
+
+async def aget_user_project(user_id, project_id):
+    """Returns the project row, or None when it doesn't exist for this user."""
+    db = await get_async_supabase()
+    res = await db.table("projects") \
+        .select("*") \
+        .eq("id", project_id) \
+        .eq("user_id", user_id) \
+        .maybe_single() \
+        .execute()
+    return res.data if res else None
@@ -0,0 +1,89 @@
+import os
+import time
+import asyncio
+import threading
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from dotenv import load_dotenv
+from src.services import (
+    get_embedding, llm_rate_limiter, record_llm_call, completion_params, estimate_request_tokens,
+    retry_delay_or_raise, LLM_BASE_URL, LLM_MAX_RETRIES,
+)
+
+load_dotenv()
+
+# Connection limits for each async HTTP client (the LLM and Supabase clients keep separate pools)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+# Encoding is CPU-bound and torch already uses every core, so one thread is usually right
+EMBED_EXECUTOR_WORKERS = int(os.getenv("EMBED_EXECUTOR_WORKERS", "1"))
+
+HTTP_LIMITS = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE)
+
+_async_client = None
+_embed_executor = ThreadPoolExecutor(max_workers=EMBED_EXECUTOR_WORKERS, thread_name_prefix="embed")
+
+def get_async_llm_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            base_url=LLM_BASE_URL,
+            api_key=os.getenv("OPENROUTER_API_KEY"),
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=HTTP_LIMITS),
+        )
+    return _async_client
+
+async def _acreate_completion(system_prompt, user_prompt, temperature, stream=False):
+    """services._create_completion on the async client: same request, budget, retries and backoff."""
+    estimated_tokens = estimate_request_tokens(system_prompt, user_prompt)
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        await asyncio.to_thread(llm_rate_limiter.acquire, estimated_tokens)
+        started = time.perf_counter()
+        try:
+            completion = await get_async_llm_client().chat.completions.create(
+                **completion_params(system_prompt, user_prompt, temperature, stream)
+            )
+        except Exception as e:
+            await asyncio.sleep(retry_delay_or_raise(attempt, e, started, stream))
+            continue
+        record_llm_call(completion, started, stream)
+        return completion
+
+async def aget_llm_completion(system_prompt, user_prompt, temperature=0.2):
+    try:
+        completion = await _acreate_completion(system_prompt, user_prompt, temperature)
+        return completion.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"LLM Error: {e}")
+        return None
+
+async def astream_llm_completion(system_prompt, user_prompt, temperature=0.2):
+    """Async generator over the answer text as it streams in. Errors propagate."""
+    stream = await _acreate_completion(system_prompt, user_prompt, temperature, stream=True)
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+async def aget_embedding(text):
+    """Runs the encoder on a dedicated executor so the event loop keeps serving requests."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_embed_executor, get_embedding, text)
+
+_sync_loop = None
+_sync_loop_lock = threading.Lock()
+
+def run_sync(coro):
+    """
+    Runs `coro` to completion for synchronous callers (scripts, benchmarks). Every call
+    uses the same background event loop, because the async clients above stay bound to
+    the loop they were first used on. Never call this from inside the server's loop.
+    """
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="sync-bridge", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop).result()
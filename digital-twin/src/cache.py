@@ -0,0 +1,215 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from src.metrics import register_collector
+
+load_dotenv()
+
+CACHE_PATH = os.getenv("LUMIS_CACHE_PATH", os.path.join("memory", "content_cache.sqlite3"))
+CACHE_MAX_MB = int(os.getenv("LUMIS_CACHE_MAX_MB", "512"))
+# Cache hits buffer their LRU timestamps; they are written with the next set, or once this many pile up
+CACHE_TOUCH_BUFFER = 1024
+
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+QUERY_EMBED_CACHE_TTL = float(os.getenv("QUERY_EMBED_CACHE_TTL", "86400"))
+CHAT_ANSWER_CACHE_SIZE = int(os.getenv("CHAT_ANSWER_CACHE_SIZE", "512"))
+CHAT_ANSWER_CACHE_TTL = float(os.getenv("CHAT_ANSWER_CACHE_TTL", "3600"))
+
+class ContentCache:
+    """
+    On-disk key/value store for values that are pure functions of code text.
+    Backed by SQLite and shared by every process on the host; evicts least recently
+    used entries once max_bytes is exceeded. A max_bytes of 0 disables the cache.
+    SQLite errors (e.g. "database is locked") count as a miss or a skipped write.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self._conn = None
+        self._total_bytes = 0
+        self._touched = {}  # key -> last hit time, written with the next write transaction
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used)")
+            # Total size kept next to the entries, so every process sharing the file bounds the same number
+            conn.execute("CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO totals (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM entries")
+            conn.commit()
+            self._total_bytes = conn.execute("SELECT bytes FROM totals").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _write(self, apply):
+        """Runs apply(conn) in one write transaction, together with the buffered LRU touches."""
+        touched, self._touched = self._touched, {}
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(t, k) for k, t in touched.items()])
+            apply(conn)
+            conn.commit()
+        except sqlite3.Error as e:
+            self.errors += 1
+            if self._conn is not None and self._conn.in_transaction:
+                self._conn.rollback()
+            print(f"Content cache write skipped: {e}")
+
+    def get(self, key):
+        if not self.max_bytes:
+            return None
+        with self._lock:
+            try:
+                row = self._connect().execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                self.errors += 1
+                print(f"Content cache read failed: {e}")
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Hits stay read-only; their access time is written with the next set
+            self._touched[key] = time.time()
+            if len(self._touched) >= CACHE_TOUCH_BUFFER:
+                self._write(lambda conn: None)
+            return row[0]
+
+    def set(self, key, value):
+        if not self.max_bytes:
+            return
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        size = len(key) + len(value)
+
+        def apply(conn):
+            old = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            conn.execute("UPDATE totals SET bytes = bytes + ?", (size - (old[0] if old else 0),))
+            self._total_bytes = conn.execute("SELECT bytes FROM totals").fetchone()[0]
+            if self._total_bytes > self.max_bytes:
+                self._evict(conn)
+
+        with self._lock:
+            self._write(apply)
+
+    def _evict(self, conn):
+        # Trim to 90% so a full cache doesn't evict on every write
+        target = int(self.max_bytes * 0.9)
+        freed = 0
+        while self._total_bytes - freed > target:
+            oldest = conn.execute("SELECT key, size FROM entries ORDER BY last_used LIMIT 256").fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                if self._total_bytes - freed <= target:
+                    break
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                freed += size
+                self.evictions += 1
+        conn.execute("UPDATE totals SET bytes = bytes - ?", (freed,))
+        self._total_bytes -= freed
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+class TTLCache:
+    """In-memory LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate):
+        """Drops every entry whose key matches `predicate`."""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+# Shared across summaries and embeddings; keys are namespaced by kind, model and prompt version
+content_cache = ContentCache(CACHE_PATH, CACHE_MAX_MB * 1024 * 1024)
+
+# Chat: normalised query -> embedding, and (project_id, last_commit, normalised query) -> answer
+query_embedding_cache = TTLCache(QUERY_EMBED_CACHE_SIZE, QUERY_EMBED_CACHE_TTL)
+answer_cache = TTLCache(CHAT_ANSWER_CACHE_SIZE, CHAT_ANSWER_CACHE_TTL)
+
+def invalidate_project_answers(project_id):
+    answer_cache.invalidate(lambda key: key[0] == project_id)
+
+def get_cache_stats():
+    return {
+        "content": content_cache.stats(),
+        "query_embeddings": query_embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+    }
+
+def collect_cache_metrics():
+    for cache, stats in get_cache_stats().items():
+        for field in ("hits", "misses", "evictions"):
+            yield f"cache_{field}_total", "counter", {"cache": cache}, stats[field]
+
+register_collector(collect_cache_metrics)
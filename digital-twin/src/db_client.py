@@ -1,6 +1,10 @@
 import os
-from supabase import create_client, Client
+import json
+import httpx
+from supabase import create_client, Client, ClientOptions
+from postgrest import CountMethod, ReturnMethod
 from dotenv import load_dotenv
+from src.metrics import http_metric_hooks
 
 load_dotenv()
 
@@ -10,7 +14,29 @@ key: str = os.environ.get("SUPABASE_KEY")
 if not url or not key:
     raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in .env")
 
-supabase: Client = create_client(url, key)
+# postgrest-py's own default; a custom httpx client would otherwise time out after 5s
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "120"))
+
+def db_target(request):
+    """`memory_units` or `rpc/match_memory_units` from a PostgREST URL, for metrics labels."""
+    path = request.url.path
+    return path.split("/rest/v1/", 1)[1] if "/rest/v1/" in path else path
+
+# Same client postgrest-py would build, plus hooks counting and timing every round trip
+supabase: Client = create_client(url, key, options=ClientOptions(httpx_client=httpx.Client(
+    timeout=DB_TIMEOUT,
+    follow_redirects=True,
+    http2=True,
+    event_hooks=http_metric_hooks("db", db_target, client="sync"),
+)))
+
+# Keeps `in_` filters well under PostgREST's URL length limits
+DB_CHUNK_SIZE = 200
+
+def chunked(items, size=DB_CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
 def get_project_risks(project_id):
     """Fetches active risk alerts for the project."""
@@ -18,30 +44,128 @@ def get_project_risks(project_id):
     response = supabase.table("project_risks").select("*").eq("project_id", project_id).order("created_at", desc=True).limit(10).execute()
     return response.data
 
+def iter_keyset_pages(build_query, key, page_size=1000):
+    """
+    Yields every row of `build_query()` (a filtered select) ordered by the unique column `key`,
+    one page (list of rows) at a time, so results are not cut off at PostgREST's max_rows.
+    """
+    last_key = None
+    while True:
+        query = build_query()
+        if last_key is not None:
+            query = query.gt(key, last_key)
+        page = query.order(key).limit(page_size).execute().data or []
+        yield page
+        if len(page) < page_size:
+            return
+        last_key = page[-1][key]
+
 def get_project_data(project_id):
-    units_resp = supabase.table("memory_units").select("unit_name, file_path, last_modified_at, author_email, content").eq("project_id", project_id).execute()
-    edges_resp = supabase.table("graph_edges").select("source_unit_name, target_unit_name").eq("project_id", project_id).execute()
-    return units_resp.data, edges_resp.data
+    pages = iter_keyset_pages(
+        lambda: supabase.table("memory_units")
+            .select("unit_name, file_path, last_modified_at, author_email, content, code_footprint, risk_score")
+            .eq("project_id", project_id),
+        "unit_name"
+    )
+    return [unit for page in pages for unit in page], get_project_edges(project_id)
+
+def get_unit_footprints(project_id, page_size=1000):
+    """Loads every (unit_name, code_footprint) for the project using keyset pagination."""
+    pages = iter_keyset_pages(
+        lambda: supabase.table("memory_units").select("unit_name, code_footprint").eq("project_id", project_id),
+        "unit_name", page_size
+    )
+    return {row["unit_name"]: row["code_footprint"] for page in pages for row in page}
+
+def iter_unit_embeddings(project_id, page_size=500):
+    """Yields pages of (unit_name, embedding) for the project using keyset pagination."""
+    pages = iter_keyset_pages(
+        lambda: supabase.table("memory_units").select("unit_name, embedding").eq("project_id", project_id),
+        "unit_name", page_size
+    )
+    for page in pages:
+        # pgvector columns come back as "[0.1,0.2,...]" strings through PostgREST
+        yield [
+            (row["unit_name"], json.loads(row["embedding"]) if isinstance(row["embedding"], str) else row["embedding"])
+            for row in page if row.get("embedding") is not None
+        ]
+
+def delete_units(project_id, unit_names):
+    """
+    Removes units and their outgoing edges in chunked `in_` batches.
+    Returns (units removed, edges removed).
+    """
+    removed_units = removed_edges = 0
+    for chunk in chunked(sorted(unit_names)):
+        # Only the counts are used; the deleted rows (content, embeddings) are not sent back
+        edges_resp = supabase.table("graph_edges").delete(count=CountMethod.exact, returning=ReturnMethod.minimal) \
+            .eq("project_id", project_id).in_("source_unit_name", chunk).execute()
+        units_resp = supabase.table("memory_units").delete(count=CountMethod.exact, returning=ReturnMethod.minimal) \
+            .eq("project_id", project_id).in_("unit_name", chunk).execute()
+        removed_edges += edges_resp.count or 0
+        removed_units += units_resp.count or 0
+    return removed_units, removed_edges
 
 def save_risk_alerts(project_id, risks):
-    if not risks:
-        return
-    
-    supabase.table("project_risks").delete().eq("project_id", project_id).eq("risk_type", "Legacy Conflict").execute()
-    supabase.table("project_risks").insert(risks).execute()
+    """
+    Applies the new Legacy Conflict alerts as a diff: rows that are already stored stay
+    untouched, stale rows are deleted and only new ones are inserted, all in chunks.
+    """
+    pages = iter_keyset_pages(
+        lambda: supabase.table("project_risks").select("id, severity, description, affected_units")
+            .eq("project_id", project_id).eq("risk_type", "Legacy Conflict"),
+        "id"
+    )
+
+    def alert_key(alert):
+        return (alert.get("severity"), alert.get("description"), tuple(alert.get("affected_units") or ()))
+
+    existing_ids = {}
+    for page in pages:
+        for row in page:
+            existing_ids.setdefault(alert_key(row), []).append(row["id"])
+
+    new_risks = []
+    for risk in risks:
+        matches = existing_ids.get(alert_key(risk))
+        if matches:
+            matches.pop()
+        else:
+            new_risks.append(risk)
+    stale_ids = [alert_id for ids in existing_ids.values() for alert_id in ids]
+
+    for chunk in chunked(stale_ids):
+        supabase.table("project_risks").delete(returning=ReturnMethod.minimal).in_("id", chunk).execute()
+    for chunk in chunked(new_risks, 500):
+        supabase.table("project_risks").insert(chunk, returning=ReturnMethod.minimal).execute()
 
 def update_unit_risk_scores(updates):
+    """
+    Writes risk scores with one chunked UPDATE per distinct (project, score), so a whole
+    project persists in a handful of round trips. Callers pass only changed scores,
+    including resets to 0. A failed chunk is reported and the rest still run.
+    Returns the number of units that could not be updated.
+    """
     if not updates:
-        return
-    try:
-        for update in updates:
-            supabase.table("memory_units") \
-                .update({"risk_score": update["risk_score"]}) \
-                .eq("project_id", update["project_id"]) \
-                .eq("unit_name", update["unit_name"]) \
-                .execute()
-    except Exception as e:
-        print(f"Failed to update risk scores: {e}")
+        return 0
+
+    by_score = {}
+    for update in updates:
+        by_score.setdefault((update["project_id"], update["risk_score"]), []).append(update["unit_name"])
+
+    failed = 0
+    for (project_id, risk_score), unit_names in by_score.items():
+        for chunk in chunked(unit_names):
+            try:
+                supabase.table("memory_units") \
+                    .update({"risk_score": risk_score}, returning=ReturnMethod.minimal) \
+                    .eq("project_id", project_id) \
+                    .in_("unit_name", chunk) \
+                    .execute()
+            except Exception as e:
+                failed += len(chunk)
+                print(f"Failed to update risk scores ({risk_score}) for {len(chunk)} units: {e}")
+    return failed
 
 def save_memory_unit(project_id, unit_data):
     payload = {
@@ -60,42 +184,52 @@ def save_memory_unit(project_id, unit_data):
         on_conflict="project_id, unit_name"
     ).execute()
 
-def save_edges(project_id, source_unit_name, calls_list):
-    if not calls_list:
-        return
-        
-    edges = []
-    for target in calls_list:
-        edges.append({
-            "project_id": project_id, 
-            "source_unit_name": source_unit_name, 
-            "target_unit_name": target
-        })
-    
-    # Using upsert for edges as well
-    return supabase.table("graph_edges").upsert(
-        edges, 
-        on_conflict="project_id, source_unit_name, target_unit_name"
-    ).execute()
+def get_project_edges(project_id, sources=None, page_size=1000):
+    """
+    Loads every edge row (id, source, target) of the project, page by page. With `sources`,
+    only edges leaving those units are read, filtered server-side in chunks.
+    """
+    def pages(build_query):
+        return iter_keyset_pages(build_query, "id", page_size)
+
+    def select_edges():
+        return supabase.table("graph_edges").select("id, source_unit_name, target_unit_name").eq("project_id", project_id)
+
+    if sources is None:
+        return [edge for page in pages(select_edges) for edge in page]
+    return [
+        edge
+        for chunk in chunked(sorted(sources))
+        for page in pages(lambda chunk=chunk: select_edges().in_("source_unit_name", chunk))
+        for edge in page
+    ]
+
+def sync_edges(project_id, edges, sources=None):
+    """
+    Reconciles graph_edges with the scanned set of (source, target) pairs. Existing edges
+    are loaded once and diffed in memory; only removals and additions are written, in
+    chunks. With `sources`, only edges leaving those units are reconciled (incremental syncs).
+    Returns (added, removed) counts.
+    """
+    existing = {(e["source_unit_name"], e["target_unit_name"]): e["id"] for e in get_project_edges(project_id, sources)}
+
+    additions = edges - existing.keys()
+    removals = existing.keys() - edges
+
+    # Stale rows go by id, so removals cost one call per chunk however many sources they span
+    for chunk in chunked(sorted(existing[edge] for edge in removals)):
+        supabase.table("graph_edges").delete(returning=ReturnMethod.minimal).eq("project_id", project_id).in_("id", chunk).execute()
+
+    rows = [
+        {"project_id": project_id, "source_unit_name": source, "target_unit_name": target}
+        for source, target in sorted(additions)
+    ]
+    for chunk in chunked(rows, 500):
+        supabase.table("graph_edges").upsert(
+            chunk,
+            on_conflict="project_id, source_unit_name, target_unit_name",
+            ignore_duplicates=True,
+            returning=ReturnMethod.minimal
+        ).execute()
 
-def save_edges(project_id, source_unit_name, calls_list):
-    if not calls_list:
-        return
-    # This prevents duplication and stale connections
-    supabase.table("graph_edges")\
-        .delete()\
-        .eq("project_id", project_id)\
-        .eq("source_unit_name", source_unit_name)\
-        .execute()
-        
-    edges = []
-    for target in calls_list:
-        edges.append({
-            "project_id": project_id, 
-            "source_unit_name": source_unit_name, 
-            "target_unit_name": target
-        })
-    
-    # 2. INSERT NEW EDGES
-    if edges:
-        supabase.table("graph_edges").insert(edges).execute()
\ No newline at end of file
+    return len(additions), len(removals)
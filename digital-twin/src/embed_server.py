@@ -0,0 +1,194 @@
+"""
+Local embedding server: one process owns the model and serves every uvicorn worker
+over a Unix socket, encoding requests that arrive within a short window as one batch.
+
+    EMBED_SERVER_SOCKET=/tmp/lumis-embed.sock python -m src.embed_server
+
+Workers started with the same EMBED_SERVER_SOCKET send their get_embedding(s) calls here.
+
+Wire format, both directions: 4-byte big-endian length, then the payload.
+Requests are JSON {"texts": [...]}. Responses are a (count, dim) uint32 header followed
+by float32 vectors, or count 0xFFFFFFFF followed by a UTF-8 error message.
+"""
+import os
+import json
+import time
+import socket
+import struct
+import asyncio
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBED_SERVER_SOCKET = os.getenv("EMBED_SERVER_SOCKET")
+# How long the server waits for more requests before encoding a batch
+EMBED_SERVER_BATCH_WINDOW_MS = float(os.getenv("EMBED_SERVER_BATCH_WINDOW_MS", "5"))
+# Texts per batch; a batch closes early once it reaches this size
+EMBED_SERVER_MAX_BATCH = int(os.getenv("EMBED_SERVER_MAX_BATCH", "128"))
+EMBED_SERVER_TIMEOUT = float(os.getenv("EMBED_SERVER_TIMEOUT", "30"))
+
+ERROR_COUNT = 0xFFFFFFFF
+_LENGTH = struct.Struct(">I")
+_HEADER = struct.Struct(">II")
+
+class EmbedServerError(Exception):
+    """The server answered with an error instead of vectors."""
+
+# --- client ---
+
+_local = threading.local()
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding server closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def _connection(socket_path):
+    # One connection per thread; the server answers each connection's requests in order
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(EMBED_SERVER_TIMEOUT)
+        conn.connect(socket_path)
+        _local.conn = conn
+    return conn
+
+def _close_connection():
+    conn = getattr(_local, "conn", None)
+    _local.conn = None
+    if conn is not None:
+        conn.close()
+
+def request_embeddings(texts, socket_path=None):
+    """Encodes `texts` on the embedding server. Returns a float32 array of shape (n, dim)."""
+    socket_path = socket_path or EMBED_SERVER_SOCKET
+    payload = json.dumps({"texts": list(texts)}).encode("utf-8")
+
+    for attempt in range(2):
+        try:
+            conn = _connection(socket_path)
+            conn.sendall(_LENGTH.pack(len(payload)) + payload)
+            body = _recv_exact(conn, _LENGTH.unpack(_recv_exact(conn, _LENGTH.size))[0])
+            break
+        except OSError:
+            # A stale connection (server restarted) gets one fresh retry
+            _close_connection()
+            if attempt:
+                raise
+
+    count, dim = _HEADER.unpack_from(body)
+    if count == ERROR_COUNT:
+        raise EmbedServerError(body[_HEADER.size:].decode("utf-8", errors="replace"))
+    return np.frombuffer(body, dtype=np.float32, offset=_HEADER.size).reshape(count, dim)
+
+# --- server ---
+
+class EmbedBatcher:
+    """Collects requests from every connection and encodes them together."""
+
+    def __init__(self, encode, window_ms=EMBED_SERVER_BATCH_WINDOW_MS, max_batch=EMBED_SERVER_MAX_BATCH):
+        self.encode = encode
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue()
+        # The model runs on one thread; batching, not threads, provides the throughput
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-server")
+        self.batches = self.texts = 0
+
+    async def embed(self, texts):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.window
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                vectors = await loop.run_in_executor(self.executor, self.encode, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            start = 0
+            for item_texts, future in batch:
+                if not future.done():
+                    future.set_result(vectors[start:start + len(item_texts)])
+                start += len(item_texts)
+
+async def _handle_connection(batcher, reader, writer):
+    try:
+        while True:
+            try:
+                size = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))[0]
+                request = json.loads(await reader.readexactly(size))
+            except asyncio.IncompleteReadError:
+                return
+            try:
+                vectors = np.ascontiguousarray(await batcher.embed(request["texts"]), dtype=np.float32)
+                body = _HEADER.pack(*vectors.shape) + vectors.tobytes()
+            except Exception as e:
+                print(f"Embedding server error: {e}")
+                body = _HEADER.pack(ERROR_COUNT, 0) + str(e).encode("utf-8")
+            writer.write(_LENGTH.pack(len(body)) + body)
+            await writer.drain()
+    except (ConnectionError, json.JSONDecodeError, KeyError) as e:
+        print(f"Embedding server dropped a connection: {e}")
+    finally:
+        writer.close()
+
+async def serve(socket_path, encode):
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    batcher = EmbedBatcher(encode)
+    batch_task = asyncio.create_task(batcher.run())
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: _handle_connection(batcher, reader, writer), path=socket_path
+    )
+    print(f"Embedding server listening on {socket_path}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+def main():
+    from src.services import embed_texts_locally, get_embed_model, EMBED_BACKEND
+
+    if not EMBED_SERVER_SOCKET:
+        raise SystemExit("Set EMBED_SERVER_SOCKET to the Unix socket path to listen on.")
+    started = time.perf_counter()
+    get_embed_model().encode(["def warmup(): pass"], convert_to_numpy=True)
+    print(f"Model ready in {time.perf_counter() - started:.1f}s ({EMBED_BACKEND} backend)")
+    asyncio.run(serve(EMBED_SERVER_SOCKET, embed_texts_locally))
+
+if __name__ == "__main__":
+    main()
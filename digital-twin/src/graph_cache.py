@@ -0,0 +1,77 @@
+import os
+import time
+import networkx as nx
+from dotenv import load_dotenv
+from src.db_client import supabase, get_project_edges, get_unit_footprints
+from src.risk_engine import build_name_index
+from src.cache import TTLCache
+from src.metrics import increment
+
+load_dotenv()
+
+# How long a cached graph is trusted before its project's last_commit is re-checked.
+# Ingestion in this process invalidates immediately; the TTL covers other workers.
+GRAPH_CACHE_TTL = float(os.getenv("GRAPH_CACHE_TTL", "60"))
+# Projects whose graphs each worker keeps; the least recently chatted-with is dropped first
+GRAPH_CACHE_SIZE = int(os.getenv("GRAPH_CACHE_SIZE", "32"))
+
+class ProjectGraph:
+    """In-memory call graph of one project at one commit."""
+
+    def __init__(self, last_commit, unit_names, edges):
+        self.last_commit = last_commit
+        self.checked_at = time.monotonic()
+        self.name_index = build_name_index(unit_names)
+        self.graph = nx.DiGraph()
+        self.graph.add_nodes_from(unit_names)
+        self.graph.add_edges_from((e["source_unit_name"], e["target_unit_name"]) for e in edges)
+
+    def dependencies(self, unit_name):
+        if unit_name not in self.graph:
+            return []
+        return sorted(self.graph.successors(unit_name))
+
+    def callers(self, unit_name):
+        """Edges target short call names, so callers of `file::name` also include callers of `name`."""
+        callers = set()
+        for key in {unit_name, unit_name.rsplit("::", 1)[-1]}:
+            if key in self.graph:
+                callers.update(self.graph.predecessors(key))
+        return sorted(callers)
+
+    def resolve(self, target, file_path=None):
+        """Best unit id for a call target: the same file's definition if any, else the first candidate."""
+        candidates = self.name_index.get(target, [])
+        local = f"{file_path}::{target}" if file_path else None
+        if local in candidates:
+            return local
+        return candidates[0] if candidates else None
+
+# Staleness is handled by GRAPH_CACHE_TTL revalidation below, so entries never expire on their own
+_graphs = TTLCache(GRAPH_CACHE_SIZE, float("inf"))
+
+def _fetch_last_commit(project_id):
+    res = supabase.table("projects").select("last_commit").eq("id", project_id).execute()
+    return res.data[0].get("last_commit") if res.data else None
+
+def get_project_graph(project_id):
+    """Returns the cached graph, rebuilding it from graph_edges when the project's commit moved."""
+    cached = _graphs.get(project_id)
+    if cached and time.monotonic() - cached.checked_at < GRAPH_CACHE_TTL:
+        increment("graph_cache_lookups_total", result="fresh")
+        return cached
+
+    last_commit = _fetch_last_commit(project_id)
+    if cached and cached.last_commit == last_commit:
+        cached.checked_at = time.monotonic()
+        increment("graph_cache_lookups_total", result="revalidated")
+        return cached
+
+    increment("graph_cache_lookups_total", result="rebuilt")
+    graph = ProjectGraph(last_commit, list(get_unit_footprints(project_id)), get_project_edges(project_id))
+    _graphs.set(project_id, graph)
+    return graph
+
+def invalidate_project_graph(project_id):
+    """Called when ingestion finishes so the next chat rebuilds from the new commit."""
+    _graphs.invalidate(lambda key: key == project_id)
@@ -0,0 +1,127 @@
+import os
+import subprocess
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Must exceed the risk engine's LEGACY_THRESHOLD_DAYS: anything older only needs to read as "legacy"
+HISTORY_WINDOW_DAYS = int(os.getenv("HISTORY_WINDOW_DAYS", "150"))
+# Per-function dates from `git blame --incremental` (one subprocess per file, so opt-in)
+HISTORY_BLAME = os.getenv("HISTORY_BLAME", "0") == "1"
+
+RECORD_MARK = "\x1e"
+# Lookup result for code with no commit inside the window. The clone holds no history
+# before the window, so the real date and author are unknown; they are stored as NULL
+# and the risk engine reads a NULL date as legacy.
+BEFORE_WINDOW = (None, None)
+
+class HistoryIndex:
+    """
+    path -> (last commit time, author email) for every path touched inside the window.
+    Paths with no commit in the window report BEFORE_WINDOW.
+    """
+
+    def __init__(self, repo_path, entries, window_start, boundary):
+        self.repo_path = repo_path
+        self.entries = entries
+        self.window_start = window_start
+        self.boundary = boundary
+        self._blame_path = None
+        self._blame_lines = []
+
+    def _blame(self, rel_path):
+        # Units of one file are looked up back to back, so remembering the last file is enough
+        if rel_path != self._blame_path:
+            self._blame_path = rel_path
+            self._blame_lines = get_blame_lines(self.repo_path, rel_path, self.window_start, self.boundary)
+        return self._blame_lines
+
+    def lookup(self, rel_path):
+        return self.entries.get(rel_path.replace("\\", "/"), BEFORE_WINDOW)
+
+    def lookup_unit(self, rel_path, start_line, end_line):
+        """Newest commit touching the unit's line range, falling back to the file's entry."""
+        if not HISTORY_BLAME or not start_line:
+            return self.lookup(rel_path)
+        lines = self._blame(rel_path)
+        touched = [lines[i] for i in range(start_line - 1, min(end_line, len(lines))) if lines[i]]
+        if not touched:
+            return self.lookup(rel_path) if not lines else BEFORE_WINDOW
+        return max(touched, key=lambda entry: entry[0])
+
+def _read_shallow_boundary(repo_path):
+    """Commits at the edge of a shallow clone list every file as added, so they can't date anything."""
+    shallow_file = os.path.join(repo_path, ".git", "shallow")
+    if not os.path.exists(shallow_file):
+        return set()
+    with open(shallow_file) as f:
+        return {line.strip() for line in f if line.strip()}
+
+def build_history_index(repo_path, window_days=HISTORY_WINDOW_DAYS):
+    """Builds a HistoryIndex from a single streamed `git log --name-status` over the window."""
+    window_start = datetime.now(timezone.utc) - timedelta(days=window_days)
+    boundary = _read_shallow_boundary(repo_path)
+    entries = {}
+
+    proc = subprocess.Popen(
+        ["git", "-c", "core.quotePath=false", "log", "--name-status", "--no-renames",
+         f"--since={window_days} days ago", f"--format={RECORD_MARK}%H%x09%ct%x09%ae"],
+        cwd=repo_path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        text=True, encoding="utf-8", errors="replace"
+    )
+    current = None
+    for line in proc.stdout:
+        line = line.rstrip("\n")
+        if line.startswith(RECORD_MARK):
+            sha, timestamp, email = line[1:].split("\t", 2)
+            current = None if sha in boundary else (datetime.fromtimestamp(int(timestamp), tz=timezone.utc), email or None)
+        elif line and current:
+            # Newest commits stream first, so the first sighting of a path is its last change
+            path = line.split("\t")[-1]
+            entries.setdefault(path, current)
+    proc.wait()
+
+    return HistoryIndex(repo_path, entries, window_start, boundary)
+
+def get_blame_lines(repo_path, rel_path, window_start, boundary=()):
+    """Per-line (commit time, author email) from `git blame --incremental`; None for pre-window lines."""
+    try:
+        output = subprocess.run(
+            ["git", "blame", "--incremental", f"--since={window_start.isoformat()}", "--", rel_path.replace("\\", "/")],
+            cwd=repo_path, capture_output=True, text=True, encoding="utf-8", errors="replace", check=True
+        ).stdout
+    except subprocess.CalledProcessError as e:
+        print(f"Warning: Could not blame {rel_path}: {e}")
+        return []
+
+    commits = {}
+    spans = []
+    sha = None
+    for line in output.splitlines():
+        parts = line.split(" ")
+        if len(parts) == 4 and len(parts[0]) == 40 and sha is None:
+            sha = parts[0]
+            spans.append((sha, int(parts[2]), int(parts[3])))
+            commits.setdefault(sha, {})
+        elif line.startswith("filename "):
+            sha = None
+        elif sha is not None and " " in line:
+            key, value = line.split(" ", 1)
+            commits[sha][key] = value
+        elif sha is not None and line == "boundary":
+            commits[sha]["boundary"] = True
+
+    total = max((start + count - 1 for _, start, count in spans), default=0)
+    lines = [None] * total
+    for sha, start, count in spans:
+        info = commits[sha]
+        if info.get("boundary") or sha in boundary or "committer-time" not in info:
+            continue
+        entry = (
+            datetime.fromtimestamp(int(info["committer-time"]), tz=timezone.utc),
+            info.get("author-mail", "").strip("<>") or None
+        )
+        for i in range(start - 1, start - 1 + count):
+            lines[i] = entry
+    return lines
@@ -1,9 +1,11 @@
 import os
 import git
 from datetime import datetime
-from tree_sitter_language_pack import get_parser
-from src.services import get_llm_completion, get_embedding, generate_footprint
+from src.parser import get_language_name, extract_units, read_unit_code
+from src.services import get_llm_completion, get_embeddings, generate_footprint, LLM_MODEL
 from src.db_client import supabase
+from src.llm_executor import run_concurrent
+from src.cache import content_cache
 
 def get_git_metadata(repo_path, file_path, repo_obj=None):
     try:
@@ -21,74 +23,61 @@ def get_git_metadata(repo_path, file_path, repo_obj=None):
         return None, None
 
 def get_code_data(file_path, supported_langs):
-    ext = os.path.splitext(file_path)[1].replace('.', '').lower()
-    extension_map = {
-        "py": "python", "js": "javascript", "mjs": "javascript",
-        "cjs": "javascript", "ts": "typescript", "rs": "rust",
-        "rb": "ruby", "cs": "csharp", "sh": "bash",
-        "yml": "yaml", "ps1": "powershell", "tf": "terraform", "md": "markdown"
-    }
-    
-    lang_name = extension_map.get(ext, ext)
-    if lang_name not in supported_langs:
+    lang_name = get_language_name(file_path, supported_langs)
+    if not lang_name:
         return []
     
     try:
-        parser = get_parser(lang_name)
-        if not parser: return []
-
         with open(file_path, "rb") as f:
             content = f.read()
-            tree = parser.parse(content)
-        
-        results = []
-        def walk(node):
-            if node.type in ["function_definition", "method_definition", "function_declaration", "method_declaration"]:
-                name_node = node.child_by_field_name('name')
-                func_name = content[name_node.start_byte:name_node.end_byte].decode('utf-8', errors='ignore') if name_node else "anonymous"
-                func_body = content[node.start_byte:node.end_byte].decode('utf-8', errors='ignore')
-                
-                calls = []
-                def find_calls(n):
-                    # CRITICAL FIX: Capture only the function name, not arguments
-                    if n.type in ["call", "call_expression"]:
-                        # This targets the name identifier (e.g., 'access_secure_data')
-                        name_id_node = n.child_by_field_name('function')
-                        if name_id_node:
-                            call_name = content[name_id_node.start_byte:name_id_node.end_byte].decode('utf-8', errors='ignore')
-                            # Clean up potential 'self.' or 'this.' prefixes if they exist
-                            if "." in call_name:
-                                call_name = call_name.split(".")[-1]
-                            calls.append(call_name)
-                    
-                    for child in n.children: 
-                        find_calls(child)
-                
-                find_calls(node)
-                results.append({"name": func_name, "code": func_body, "calls": list(set(calls))})
-
-            for child in node.children: walk(child)
-
-        walk(tree.root_node)
-        return results
+        return [{**unit, "code": read_unit_code(content, unit)} for unit in extract_units(content, lang_name)]
     except Exception as e:
         print(f"Parsing error in {file_path}: {e}")
         return []
 
-def enrich_block(code_block, unit_name):
+# Bump whenever the summary prompt changes so cached summaries are not reused
+SUMMARY_PROMPT_VERSION = "v1"
+
+def summarize_block(code_block, unit_name):
+    cache_key = f"summary:{SUMMARY_PROMPT_VERSION}:{LLM_MODEL}:{generate_footprint(code_block)}"
+    cached = content_cache.get(cache_key)
+    if cached is not None:
+        # An empty entry records a SKIP verdict
+        return cached.decode("utf-8") or None
+
     system_msg = """You are a technical code analyst. Summarize the core logic in one clear sentence.
     If purely boilerplate/empty, return: SKIP"""
     
     summary = get_llm_completion(system_msg, f"Function Name: {unit_name}\nCode:\n{code_block}")
     
-    if not summary or "SKIP" in summary.upper():
+    # Failed calls are not cached so the next sync retries them
+    if not summary:
         return None
-    
-    return {
-        "summary": summary,
-        "embedding": get_embedding(code_block),
-        "footprint": generate_footprint(code_block)
-    }
+    if "SKIP" in summary.upper():
+        content_cache.set(cache_key, "")
+        return None
+
+    content_cache.set(cache_key, summary)
+    return summary
+
+def enrich_blocks(blocks):
+    """Summarizes each (code, name) block concurrently, then embeds the survivors in batches. Keeps input order."""
+    summaries = run_concurrent(lambda block: summarize_block(*block), blocks)
+    kept = [i for i, summary in enumerate(summaries) if summary]
+    vectors = get_embeddings([blocks[i][0] for i in kept])
+
+    results = [None] * len(blocks)
+    for row, i in enumerate(kept):
+        code_block = blocks[i][0]
+        results[i] = {
+            "summary": summaries[i],
+            "embedding": vectors[row].tolist(),
+            "footprint": generate_footprint(code_block)
+        }
+    return results
+
+def enrich_block(code_block, unit_name):
+    return enrich_blocks([(code_block, unit_name)])[0]
 
 def ingest_repo(repo_url, project_id, user_id, progress_callback=None):
     repo_path = f"./temp_repos/{project_id}"
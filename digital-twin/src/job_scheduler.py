@@ -0,0 +1,162 @@
+import os
+import heapq
+import itertools
+import threading
+import traceback
+from dotenv import load_dotenv
+from src.metrics import register_collector
+
+load_dotenv()
+
+# Ingestions running at once across all projects; each one parses, embeds and calls the LLM
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Whether a newer push stops the project's running sync at its next progress update
+INGEST_CANCEL_SUPERSEDED = os.getenv("INGEST_CANCEL_SUPERSEDED", "1") == "1"
+
+# Lower runs first: a user waiting on a first ingest beats a background re-sync
+PRIORITY_INTERACTIVE = 0
+PRIORITY_WEBHOOK = 1
+
+class JobCancelled(Exception):
+    """Raised at a progress update once a newer job for the same project is queued."""
+
+class IngestJob:
+    def __init__(self, seq, project_id, priority, fn, args, status_callback, key=None):
+        self.seq = seq
+        self.project_id = project_id
+        self.priority = priority
+        self.fn = fn
+        self.args = args
+        self.status_callback = status_callback
+        self.key = key
+        self.cancelled = threading.Event()
+
+    def report(self, step, log_message=None, error=None, progress=None):
+        """
+        The status callback handed to the job. Progress updates double as cancellation
+        points; final DONE/Error reports always go through.
+        """
+        if self.cancelled.is_set() and step in ("STARTING", "PROCESSING"):
+            raise JobCancelled(f"Superseded by a newer job for project {self.project_id}")
+        self.status_callback(step, log_message, error, progress)
+
+    def run(self):
+        return self.fn(*self.args, self.report)
+
+class IngestScheduler:
+    """
+    Bounded worker pool for ingestion jobs. A project runs at most one job at a time and
+    keeps at most one queued job: a newer submission replaces the queued one (keeping the
+    better priority) and asks the running one to stop.
+    The pool is per process; main.workspace_lock keeps workers from overlapping on a project.
+    """
+
+    def __init__(self, workers=INGEST_WORKERS):
+        self.workers = max(1, workers)
+        self._cond = threading.Condition()
+        self._heap = []      # (priority, seq, project_id); stale entries are skipped
+        self._pending = {}   # project_id -> newest queued job
+        self._running = {}   # project_id -> running job
+        self._seq = itertools.count()
+        self._threads = []
+        self.counters = {"submitted": 0, "coalesced": 0, "duplicates": 0, "cancelled": 0, "completed": 0}
+
+    def submit(self, project_id, fn, args, status_callback, priority=PRIORITY_WEBHOOK, key=None):
+        """
+        Queues fn(*args, status_callback) for the project. `key` identifies the target
+        (e.g. the pushed SHA) so redelivered webhooks are dropped.
+        Returns "queued", "coalesced" or "duplicate".
+        """
+        with self._cond:
+            running = self._running.get(project_id)
+            pending = self._pending.get(project_id)
+            if key is not None and any(
+                job is not None and job.key == key and not job.cancelled.is_set()
+                for job in (running, pending)
+            ):
+                self.counters["duplicates"] += 1
+                return "duplicate"
+
+            job = IngestJob(next(self._seq), project_id, priority, fn, args, status_callback, key)
+            outcome = "queued"
+            if pending is not None:
+                job.priority = min(job.priority, pending.priority)
+                self.counters["coalesced"] += 1
+                outcome = "coalesced"
+            if running is not None and INGEST_CANCEL_SUPERSEDED and not running.cancelled.is_set():
+                running.cancelled.set()
+                self.counters["cancelled"] += 1
+
+            self._pending[project_id] = job
+            heapq.heappush(self._heap, (job.priority, job.seq, project_id))
+            self.counters["submitted"] += 1
+            self._start_workers()
+            self._cond.notify_all()
+            return outcome
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"ingest-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _next_job(self):
+        # Projects with a job already running wait in the heap until it finishes
+        deferred = []
+        job = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            _, seq, project_id = entry
+            candidate = self._pending.get(project_id)
+            if candidate is None or candidate.seq != seq:
+                continue
+            if project_id in self._running:
+                deferred.append(entry)
+                continue
+            job = self._pending.pop(project_id)
+            break
+        for entry in deferred:
+            heapq.heappush(self._heap, entry)
+        return job
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                self._running[job.project_id] = job
+
+            try:
+                job.run()
+            except JobCancelled as e:
+                print(f"Ingestion Skipped: {e}")
+            except Exception:
+                print(f"Ingestion Job Crashed for {job.project_id}:")
+                print(traceback.format_exc())
+            finally:
+                with self._cond:
+                    self._running.pop(job.project_id, None)
+                    self.counters["completed"] += 1
+                    self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "running": sorted(self._running),
+                "queued": sorted(self._pending),
+                **self.counters,
+            }
+
+ingest_scheduler = IngestScheduler()
+
+def collect_scheduler_metrics():
+    stats = ingest_scheduler.stats()
+    for event in ("submitted", "coalesced", "duplicates", "cancelled", "completed"):
+        yield "ingest_jobs_total", "counter", {"event": event}, stats[event]
+    yield "ingest_jobs_running", "gauge", {}, len(stats["running"])
+    yield "ingest_jobs_queued", "gauge", {}, len(stats["queued"])
+
+register_collector(collect_scheduler_metrics)
@@ -0,0 +1,61 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How many LLM requests may be in flight at once
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+
+class RateLimiter:
+    """Token-bucket budget for requests and tokens per minute. A limit of 0 disables that bucket."""
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens=0):
+        """Blocks until one request carrying `tokens` fits in the budget."""
+        if not self.rpm and not self.tpm:
+            return
+        # A single oversized request can never fit a full bucket; let it through alone
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+
+        while True:
+            with self._lock:
+                self._refill()
+                wait = 0.0
+                if self.rpm and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+                if wait == 0:
+                    if self.rpm:
+                        self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= tokens
+                    return
+            time.sleep(wait)
+
+def run_concurrent(fn, items, max_workers=None):
+    """Applies fn to every item on a bounded thread pool. Results keep input order."""
+    items = list(items)
+    workers = min(max_workers or LLM_CONCURRENCY, len(items))
+    if workers <= 1:
+        return [fn(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm") as pool:
+        return list(pool.map(fn, items))
@@ -0,0 +1,228 @@
+import os
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Every exported metric name starts with this
+METRICS_PREFIX = "lumis_"
+# Histogram upper bounds in seconds; stages range from milliseconds (cache hits) to minutes (clones)
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Where profiled runs write their .prof files (open with `python -m pstats` or snakeviz)
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("memory", "profiles"))
+
+METRIC_HELP = {
+    "ingest_stage_seconds": "Wall time of each ingestion stage.",
+    "ingest_runs_total": "Ingestion and incremental sync runs by outcome.",
+    "ingest_enrich_seconds": "Summarising and embedding one batch of changed units.",
+    "ingest_save_seconds": "Writing one batch of enriched units to Supabase.",
+    "risk_phase_seconds": "Wall time of each predictive risk analysis phase.",
+    "chat_stage_seconds": "Wall time of chat retrieval and answer generation.",
+    "db_requests_total": "Supabase HTTP requests by table (or rpc) and method.",
+    "db_request_seconds": "Supabase request latency up to the response headers.",
+    "llm_requests_total": "LLM chat completions by mode and outcome.",
+    "llm_retries_total": "LLM requests retried after a 429 or 5xx.",
+    "llm_tokens_total": "LLM tokens reported by the provider.",
+    "llm_request_seconds": "LLM latency until the completion (or the stream) is returned.",
+    "embeddings_total": "Texts embedded, by where the vector came from.",
+    "embed_batch_seconds": "Time to encode one batch with the local model.",
+    "graph_cache_lookups_total": "Chat graph lookups: served fresh, revalidated or rebuilt.",
+    "cache_hits_total": "Cache hits per cache.",
+    "cache_misses_total": "Cache misses per cache.",
+    "cache_evictions_total": "Cache evictions per cache.",
+    "ingest_jobs_total": "Ingestion scheduler job events.",
+    "ingest_jobs_running": "Ingestion jobs currently running.",
+    "ingest_jobs_queued": "Ingestion jobs waiting for a worker.",
+}
+
+class Histogram:
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+# (name, sorted label items) -> value / Histogram; per process, like every other cache here
+_counters = {}
+_histograms = {}
+_collectors = []
+_lock = threading.Lock()
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def increment(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+@contextmanager
+def span(name, **labels):
+    """Times the block into the `name` histogram, whether it returns or raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+class StageTimer:
+    """
+    Times consecutive stages of one run: each stage() call ends the previous stage.
+    Keeps the durations so the run can print a one-line breakdown when it ends.
+    """
+
+    def __init__(self, name, label="stage", **labels):
+        self.name = name
+        self.label = label
+        self.labels = labels
+        self.durations = {}
+        self._stage = None
+        self._started = None
+
+    def stage(self, stage):
+        self.end()
+        self._stage = stage
+        self._started = time.perf_counter()
+
+    def end(self):
+        if self._stage is None:
+            return
+        elapsed = time.perf_counter() - self._started
+        observe(self.name, elapsed, **{self.label: self._stage}, **self.labels)
+        self.durations[self._stage] = self.durations.get(self._stage, 0.0) + elapsed
+        self._stage = None
+
+    def summary(self):
+        return ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in self.durations.items())
+
+def register_collector(collect):
+    """`collect()` is called on every scrape and returns (name, type, labels, value) samples."""
+    _collectors.append(collect)
+
+def http_metric_hooks(prefix, target_of, asynchronous=False, **labels):
+    """
+    httpx event hooks counting every request as `{prefix}_requests_total{target, method, status}`
+    and timing it into `{prefix}_request_seconds`. `target_of(request)` names what was called.
+    """
+    def on_request(request):
+        request.extensions["metrics_started"] = time.perf_counter()
+
+    def on_response(response):
+        request = response.request
+        increment(f"{prefix}_requests_total", target=target_of(request), method=request.method,
+                  status=response.status_code, **labels)
+        started = request.extensions.get("metrics_started")
+        if started is not None:
+            observe(f"{prefix}_request_seconds", time.perf_counter() - started, **labels)
+
+    if not asynchronous:
+        return {"request": [on_request], "response": [on_response]}
+
+    async def on_request_async(request):
+        on_request(request)
+
+    async def on_response_async(response):
+        on_response(response)
+
+    return {"request": [on_request_async], "response": [on_response_async]}
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(items, extra=()):
+    items = list(items) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_metrics():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    families = {}
+    with _lock:
+        for (name, labels), value in _counters.items():
+            families.setdefault((name, "counter"), []).append((labels, value))
+        histograms = [
+            (name, labels, list(h.counts), h.sum, h.count, h.buckets)
+            for (name, labels), h in _histograms.items()
+        ]
+    for collect in _collectors:
+        try:
+            for name, kind, labels, value in collect():
+                families.setdefault((name, kind), []).append((tuple(sorted((k, str(v)) for k, v in labels.items())), value))
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+
+    lines = []
+
+    def header(name, kind):
+        full_name = METRICS_PREFIX + name
+        if name in METRIC_HELP:
+            lines.append(f"# HELP {full_name} {METRIC_HELP[name]}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        return full_name
+
+    for (name, kind), samples in sorted(families.items()):
+        full_name = header(name, kind)
+        for labels, value in sorted(samples):
+            lines.append(f"{full_name}{_labels(labels)} {_format_value(value)}")
+
+    seen = set()
+    for name, labels, counts, total, count, buckets in sorted(histograms, key=lambda h: (h[0], h[1])):
+        full_name = METRICS_PREFIX + name
+        if name not in seen:
+            seen.add(name)
+            header(name, "histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{full_name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{full_name}_bucket{_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{full_name}_sum{_labels(labels)} {total!r}")
+        lines.append(f"{full_name}_count{_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+@contextmanager
+def profile_run(label):
+    """
+    Captures a cProfile of the block into PROFILE_DIR/<label>-<timestamp>.prof.
+    Only the calling thread is profiled; worker pools show up as time spent waiting on them.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        profiler.dump_stats(path)
+        print(f"Profile written to {path}")
+
+def profiled(fn, label):
+    """Wraps `fn` so its next call runs under profile_run(label)."""
+    def run(*args, **kwargs):
+        with profile_run(label):
+            return fn(*args, **kwargs)
+    return run
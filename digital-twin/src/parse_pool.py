@@ -0,0 +1,55 @@
+import os
+import threading
+import multiprocessing
+from dotenv import load_dotenv
+from src.parser import get_language_name, parse_file
+
+load_dotenv()
+
+# 0 means one worker per core; 1 parses inline in the calling thread
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) or os.cpu_count() or 1
+# Small scans aren't worth the round trip to the pool
+PARSE_POOL_MIN_FILES = int(os.getenv("PARSE_POOL_MIN_FILES", "32"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _parse_task(task):
+    rel_path, file_path, lang_name = task
+    return rel_path, parse_file(file_path, lang_name)
+
+def get_parse_pool():
+    """
+    Lazily starts one process pool shared by every ingestion in this process.
+    forkserver keeps workers from inheriting the parent's threads and loaded models.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            context = multiprocessing.get_context(method)
+            if method == "forkserver":
+                context.set_forkserver_preload(["src.parser"])
+            _pool = context.Pool(PARSE_WORKERS)
+        return _pool
+
+def iter_parsed_files(repo_path, rel_paths, supported_langs):
+    """
+    Yields (rel_path, units) for every file, streaming results as workers finish so
+    enrichment can start before the scan is done. Unsupported files yield no units.
+    """
+    tasks = []
+    for rel_path in rel_paths:
+        lang_name = get_language_name(rel_path, supported_langs)
+        if lang_name:
+            tasks.append((rel_path, os.path.join(repo_path, rel_path), lang_name))
+        else:
+            yield rel_path, []
+
+    if PARSE_WORKERS <= 1 or len(tasks) < PARSE_POOL_MIN_FILES:
+        for task in tasks:
+            yield _parse_task(task)
+        return
+
+    chunksize = max(1, min(16, len(tasks) // (PARSE_WORKERS * 4)))
+    yield from get_parse_pool().imap_unordered(_parse_task, tasks, chunksize=chunksize)
@@ -0,0 +1,130 @@
+import os
+import hashlib
+from functools import lru_cache
+from tree_sitter import Query, QueryError
+from tree_sitter_language_pack import get_parser, get_language
+
+try:
+    from tree_sitter import QueryCursor  # py-tree-sitter >= 0.25
+except ImportError:
+    QueryCursor = None
+
+# Kept free of model/database imports: parse workers import this module directly
+
+EXTENSION_MAP = {
+    "py": "python", "js": "javascript", "mjs": "javascript",
+    "cjs": "javascript", "ts": "typescript", "rs": "rust",
+    "rb": "ruby", "cs": "csharp", "sh": "bash",
+    "yml": "yaml", "ps1": "powershell", "tf": "terraform", "md": "markdown"
+}
+
+DEFINITION_TYPES = ["function_definition", "method_definition", "function_declaration", "method_declaration"]
+CALL_TYPES = ["call", "call_expression"]
+
+def generate_footprint(text):
+    """Creates a unique SHA-256 hash for a string of code."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def get_language_name(file_path, supported_langs):
+    ext = os.path.splitext(file_path)[1].replace('.', '').lower()
+    lang_name = EXTENSION_MAP.get(ext, ext)
+    return lang_name if lang_name in supported_langs else None
+
+@lru_cache(maxsize=None)
+def get_cached_parser(lang_name):
+    """One parser per language per process; parse workers keep theirs warm across files."""
+    return get_parser(lang_name)
+
+@lru_cache(maxsize=None)
+def get_unit_query(lang_name):
+    """
+    Precompiled query capturing every definition (@definition) and call target (@call)
+    for the language. Node types the grammar doesn't have are left out of the query.
+    """
+    language = get_language(lang_name)
+    patterns = [f"({kind}) @definition" for kind in DEFINITION_TYPES]
+    patterns += [f"({kind} function: (_) @call)" for kind in CALL_TYPES]
+
+    valid = []
+    for pattern in patterns:
+        try:
+            Query(language, pattern)
+            valid.append(pattern)
+        except (QueryError, NameError, SyntaxError, ValueError):
+            continue
+    return Query(language, "\n".join(valid)) if valid else None
+
+def _captures(query, node):
+    if QueryCursor is not None:
+        return QueryCursor(query).captures(node)
+    return query.captures(node)
+
+def _node_text(content, node):
+    return content[node.start_byte:node.end_byte].decode('utf-8', errors='ignore')
+
+def extract_units(content, lang_name):
+    """
+    Returns compact records for every function/method in `content`:
+    name, byte and line range, footprint of the decoded body and the names it calls.
+
+    One query cursor pass collects definitions and call targets; calls are then
+    attributed with a single sweep in byte order. A definition's calls include those
+    of functions nested inside it.
+    """
+    parser = get_cached_parser(lang_name)
+    query = get_unit_query(lang_name)
+    if not parser or not query: return []
+    tree = parser.parse(content)
+
+    captures = _captures(query, tree.root_node)
+    definitions = sorted(captures.get("definition", []), key=lambda n: (n.start_byte, -n.end_byte))
+    call_nodes = sorted(captures.get("call", []), key=lambda n: n.start_byte)
+
+    calls = [set() for _ in definitions]
+    open_defs = []
+
+    def close_until(position):
+        # Nested definitions close before their parents; their calls bubble up
+        while open_defs and definitions[open_defs[-1]].end_byte <= position:
+            closed = open_defs.pop()
+            if open_defs:
+                calls[open_defs[-1]].update(calls[closed])
+
+    next_call = 0
+    for i, node in enumerate(definitions + [None]):
+        position = node.start_byte if node is not None else len(content) + 1
+        while next_call < len(call_nodes) and call_nodes[next_call].start_byte < position:
+            call_node = call_nodes[next_call]
+            next_call += 1
+            close_until(call_node.start_byte)
+            if open_defs:
+                # Capture only the function name, not arguments or 'self.'/'this.' prefixes
+                calls[open_defs[-1]].add(_node_text(content, call_node).split(".")[-1])
+        close_until(position)
+        if node is not None:
+            open_defs.append(i)
+
+    results = []
+    for i, node in enumerate(definitions):
+        name_node = node.child_by_field_name('name')
+        results.append({
+            "name": _node_text(content, name_node) if name_node else "anonymous",
+            "start_byte": node.start_byte, "end_byte": node.end_byte,
+            "start_line": node.start_point[0] + 1, "end_line": node.end_point[0] + 1,
+            "footprint": generate_footprint(_node_text(content, node)),
+            "calls": list(calls[i])
+        })
+    return results
+
+def parse_file(file_path, lang_name):
+    """Reads and parses one file. Errors are reported and yield no units, like get_code_data."""
+    try:
+        with open(file_path, "rb") as f:
+            content = f.read()
+        return extract_units(content, lang_name)
+    except Exception as e:
+        print(f"Parsing error in {file_path}: {e}")
+        return []
+
+def read_unit_code(content, unit):
+    return content[unit["start_byte"]:unit["end_byte"]].decode('utf-8', errors='ignore')
@@ -0,0 +1,163 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Log lines kept per project; older lines are dropped
+PROGRESS_LOG_SIZE = int(os.getenv("PROGRESS_LOG_SIZE", "200"))
+# Minimum gap between two events pushed to a subscriber; bursts collapse into the latest state
+PROGRESS_THROTTLE_SECONDS = float(os.getenv("PROGRESS_THROTTLE_SECONDS", "0.5"))
+# Comment frames keep idle SSE connections open through proxies
+PROGRESS_KEEPALIVE_SECONDS = float(os.getenv("PROGRESS_KEEPALIVE_SECONDS", "15"))
+
+FINAL_STATUSES = ("DONE", "Error")
+
+class ProjectProgress:
+    """Status, structured counters and a bounded log for one project's ingestion."""
+
+    def __init__(self, status="IDLE", step=None):
+        self.status = status
+        self.step = step
+        self.error = None
+        self.logs = deque(maxlen=PROGRESS_LOG_SIZE)
+        self.log_seq = 0
+        self.progress = {}
+        self.files_started_at = None
+        self.version = 0
+
+    def add_log(self, line):
+        self.log_seq += 1
+        self.logs.append((self.log_seq, line))
+
+    def eta_seconds(self):
+        done, total = self.progress.get("files_done", 0), self.progress.get("files_total", 0)
+        if not self.files_started_at or not done or done >= total:
+            return None
+        elapsed = time.monotonic() - self.files_started_at
+        return round(elapsed / done * (total - done), 1)
+
+    def snapshot(self, since_log=0):
+        """`since_log` is the last log sequence number the client has; only newer lines are returned."""
+        return {
+            "status": self.status,
+            "step": self.step,
+            "error": self.error,
+            "logs": [line for seq, line in self.logs if seq > since_log],
+            "log_seq": self.log_seq,
+            "progress": {**self.progress, "eta_seconds": self.eta_seconds()},
+            "version": self.version,
+        }
+
+class ProgressHub:
+    """
+    Progress for every project, written from ingestion threads and read by the poll
+    endpoint and by event-loop subscribers (SSE), which are woken thread-safely.
+    """
+
+    def __init__(self):
+        self._projects = {}
+        self._waiters = {}  # project_id -> {(loop, asyncio.Event)}
+        self._lock = threading.Lock()
+
+    def _notify(self, project_id):
+        for loop, event in list(self._waiters.get(project_id, ())):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The subscriber's loop is gone
+                pass
+
+    def start(self, project_id, status, step, log_message=None):
+        """Replaces the project's state, e.g. when a new ingestion is requested."""
+        with self._lock:
+            previous = self._projects.get(project_id)
+            state = ProjectProgress(status, step)
+            state.version = previous.version + 1 if previous else 1
+            if log_message:
+                state.add_log(log_message)
+            self._projects[project_id] = state
+            self._notify(project_id)
+
+    def update(self, project_id, step, log_message=None, error=None, progress=None):
+        with self._lock:
+            state = self._projects.get(project_id)
+            if state is None:
+                state = self._projects[project_id] = ProjectProgress()
+
+            state.step = step
+            if log_message:
+                state.add_log(log_message)
+            if progress:
+                if progress.get("files_total") and state.files_started_at is None:
+                    state.files_started_at = time.monotonic()
+                state.progress.update(progress)
+
+            if error:
+                state.status = "Error"
+                state.error = str(error)
+            elif step == "DONE":
+                state.status = "DONE"
+            elif step == "STARTING":
+                state.status = "STARTING"
+                state.progress, state.files_started_at, state.error = {}, None, None
+            else:
+                state.status = "PROCESSING"
+            state.version += 1
+            self._notify(project_id)
+
+    def snapshot(self, project_id, since_log=0):
+        with self._lock:
+            state = self._projects.get(project_id)
+            return state.snapshot(since_log) if state else None
+
+    def reset_if_done(self, project_id):
+        """The poll endpoint hands out DONE once, then the project reads as IDLE again."""
+        with self._lock:
+            state = self._projects.get(project_id)
+            if state and state.status == "DONE":
+                self._projects[project_id] = ProjectProgress()
+                self._projects[project_id].version = state.version + 1
+
+    async def subscribe(self, project_id, since_log=0):
+        """
+        Yields a snapshot whenever the project's progress changes, at most once per
+        PROGRESS_THROTTLE_SECONDS, and None as a keepalive. Ends after DONE or Error.
+        """
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        waiter = (loop, event)
+        with self._lock:
+            self._waiters.setdefault(project_id, set()).add(waiter)
+
+        try:
+            version = None
+            while True:
+                event.clear()
+                snapshot = self.snapshot(project_id, since_log)
+                if snapshot is None:
+                    snapshot = {"status": "IDLE", "version": 0}
+                if snapshot["version"] != version:
+                    version = snapshot["version"]
+                    since_log = snapshot.get("log_seq", since_log)
+                    yield snapshot
+                    if snapshot["status"] in FINAL_STATUSES:
+                        return
+                    await asyncio.sleep(PROGRESS_THROTTLE_SECONDS)
+                    continue
+                try:
+                    await asyncio.wait_for(event.wait(), PROGRESS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(project_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[project_id]
+
+progress_hub = ProgressHub()
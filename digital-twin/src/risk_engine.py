@@ -1,10 +1,24 @@
+import os
 from datetime import datetime, timezone
+from dotenv import load_dotenv
 from src.db_client import get_project_data, save_risk_alerts, update_unit_risk_scores
-from src.services import get_llm_completion
+from src.services import get_llm_completion, generate_footprint, LLM_MODEL
+from src.llm_executor import run_concurrent
+from src.cache import content_cache
+from src.metrics import StageTimer
 
-def analyze_conflict_with_llm(source_name, source_code, target_name, target_code):
+load_dotenv()
+
+# Most conflict pairs sent to the LLM per run; the rest get a heuristic description
+RISK_LLM_MAX_PAIRS = int(os.getenv("RISK_LLM_MAX_PAIRS", "50"))
+# Bump whenever the conflict prompt changes so cached analyses are not reused
+CONFLICT_PROMPT_VERSION = "v1"
+FALLBACK_ANALYSIS = "Standard dependency risk detected."
+
+def request_conflict_analysis(source_name, source_code, target_name, target_code):
     """
     Uses the LLM to determine if the interaction between new and legacy code is dangerous.
+    Returns None when the LLM call fails.
     """
     system_prompt = (
         "You are a Senior Software Architect specializing in legacy modernization. "
@@ -22,28 +36,94 @@ def analyze_conflict_with_llm(source_name, source_code, target_name, target_code
         "If you see a specific mismatch (e.g. arguments, types), explain it."
     )
     
-    analysis = get_llm_completion(system_prompt, user_prompt)
-    return analysis if analysis else "Standard dependency risk detected."
+    return get_llm_completion(system_prompt, user_prompt)
+
+def analyze_conflict_with_llm(source_name, source_code, target_name, target_code):
+    analysis = request_conflict_analysis(source_name, source_code, target_name, target_code)
+    return analysis if analysis else FALLBACK_ANALYSIS
+
+def _unit_footprint(unit):
+    return unit.get('code_footprint') or generate_footprint(unit.get('content') or '')
+
+def analyze_conflicts(pairs, unit_map):
+    """
+    LLM analysis for (recent, legacy) pairs, run concurrently. Results are cached by both
+    units' footprints, so pairs whose code didn't change reuse their previous analysis.
+    """
+    keys = [
+        f"conflict:{CONFLICT_PROMPT_VERSION}:{LLM_MODEL}:{_unit_footprint(unit_map[source])}:{_unit_footprint(unit_map[target])}"
+        for source, target in pairs
+    ]
+    analyses = [content_cache.get(key) for key in keys]
+    missing = [i for i, cached in enumerate(analyses) if cached is None]
+
+    def analyze(i):
+        source, target = pairs[i]
+        return request_conflict_analysis(
+            source, unit_map[source].get('content', ''),
+            target, unit_map[target].get('content', '')
+        )
+
+    for i, analysis in zip(missing, run_concurrent(analyze, missing)):
+        if analysis:
+            content_cache.set(keys[i], analysis)
+        analyses[i] = analysis
+
+    return [
+        (analysis.decode("utf-8") if isinstance(analysis, bytes) else analysis) or FALLBACK_ANALYSIS
+        for analysis in analyses
+    ]
+
+def describe_conflict_heuristically(source_unit, target_unit):
+    """
+    Built from the stored commit dates rather than ages, so the text (which save_risk_alerts
+    diffs on) stays the same from one day to the next.
+    """
+    return (
+        f"{FALLBACK_ANALYSIS} Caller changed {source_unit.get('last_modified_at') or 'recently'}; "
+        f"callee last changed {target_unit.get('last_modified_at') or 'before the history window'} (not reviewed by AI this run)."
+    )
+
+def build_name_index(unit_names):
+    """
+    Maps each full `file::name` id and each short name to every unit it can refer to.
+    Candidate lists are sorted so ambiguous short names resolve the same way every run.
+    """
+    index = {}
+    for unit_name in unit_names:
+        index.setdefault(unit_name, set()).add(unit_name)
+        short_name = unit_name.rsplit("::", 1)[-1]
+        if short_name != unit_name:
+            index.setdefault(short_name, set()).add(unit_name)
+    return {key: sorted(candidates) for key, candidates in index.items()}
 
 def calculate_predictive_risks(project_id):
     print(f"Starting Risk Analysis for {project_id}...")
-    
+    timer = StageTimer("risk_phase_seconds", label="phase")
+
     # 1. Fetch Graph Data
+    timer.stage("load_graph")
     units, edges = get_project_data(project_id)
     if not units:
+        timer.end()
         return 0
 
     # 2. Define Thresholds
+    timer.stage("classify_ages")
     now = datetime.now(timezone.utc)
     LEGACY_THRESHOLD_DAYS = 120  # ~4 months
     RECENT_THRESHOLD_DAYS = 30   # 1 month
     
     legacy_units = {}
     recent_units = set()
+    unit_ages = {}
     unit_map = {u['unit_name']: u for u in units}
     
     for unit in units:
         if not unit.get('last_modified_at'):
+            # Ingestion leaves the date NULL for code untouched since before its history window
+            unit_ages[unit['unit_name']] = float('inf')
+            legacy_units[unit['unit_name']] = unit
             continue
             
         try:
@@ -52,57 +132,76 @@ def calculate_predictive_risks(project_id):
             continue 
             
         age_days = (now - last_mod).days
+        unit_ages[unit['unit_name']] = age_days
         
         if age_days > LEGACY_THRESHOLD_DAYS:
             legacy_units[unit['unit_name']] = unit
         elif age_days < RECENT_THRESHOLD_DAYS:
             recent_units.add(unit['unit_name'])
 
+    # 3. Index names once so each edge resolves with hash lookups
+    legacy_index = build_name_index(legacy_units)
+    recent_index = build_name_index(recent_units)
+
     # 4. Detect Conflicts (Edges)
+    timer.stage("detect_conflicts")
     risks = []
     risk_scores = {}
+    seen_pairs = set()
+    detected = []
     
     print(f"Analyzing {len(edges)} dependencies for conflicts...")
     
     for edge in edges:
         source = edge['source_unit_name']
         target = edge['target_unit_name']
+
+        # Ambiguous short names fan out to every candidate unit
+        conflict_pairs = [
+            (recent_key, legacy_key)
+            for recent_key in recent_index.get(source, ())
+            for legacy_key in legacy_index.get(target, ())
+        ]
+
+        for pair in conflict_pairs:
+            if pair not in seen_pairs:
+                seen_pairs.add(pair)
+                detected.append(pair)
+
+    # Freshest callers of the oldest legacy code get LLM review first
+    detected.sort(key=lambda pair: (unit_ages[pair[0]], -unit_ages[pair[1]]))
+    reviewed = detected[:RISK_LLM_MAX_PAIRS]
+    print(f"Detected {len(detected)} conflicts; {len(reviewed)} sent for AI analysis.")
+    timer.stage("analyze_conflicts")
+    analyses = [("AI Analysis", analysis) for analysis in analyze_conflicts(reviewed, unit_map)]
+    analyses += [
+        ("Heuristic", describe_conflict_heuristically(unit_map[s], unit_map[t]))
+        for s, t in detected[len(reviewed):]
+    ]
+
+    for (matched_recent_key, matched_legacy_key), (label, analysis) in zip(detected, analyses):
+        target_unit = legacy_units[matched_legacy_key]
+
+        description = (
+            f"Legacy Conflict: Active code '{matched_recent_key}' depends on '{matched_legacy_key}' "
+            f"(last touched {target_unit.get('last_modified_at') or 'before the history window'}).\n"
+            f"{label}: {analysis}"
+        )
         
-        matched_legacy_key = next((k for k in legacy_units.keys() if k == target or k.endswith(f"::{target}")), None)
+        risks.append({
+            "project_id": project_id,
+            "risk_type": "Legacy Conflict",
+            "severity": "Medium", 
+            "description": description,
+            "affected_units": [matched_recent_key, matched_legacy_key]
+        })
         
-        matched_recent_key = next((k for k in recent_units if k == source or k.endswith(f"::{source}")), None)
-
-        if matched_recent_key and matched_legacy_key:
-            target_unit = legacy_units[matched_legacy_key]
-            source_unit = unit_map[matched_recent_key]
-            
-            print(f"Detected conflict: {matched_recent_key} -> {matched_legacy_key}")
-            
-            # --- LLM Semantic Analysis ---
-            analysis = analyze_conflict_with_llm(
-                matched_recent_key, source_unit.get('content', ''),
-                matched_legacy_key, target_unit.get('content', '')
-            )
-            
-            description = (
-                f"Legacy Conflict: Active code '{matched_recent_key}' depends on '{matched_legacy_key}' "
-                f"(last touched {target_unit.get('last_modified_at', 'unknown')}).\n"
-                f"AI Analysis: {analysis}"
-            )
-            
-            risks.append({
-                "project_id": project_id,
-                "risk_type": "Legacy Conflict",
-                "severity": "Medium", 
-                "description": description,
-                "affected_units": [matched_recent_key, matched_legacy_key]
-            })
-            
-            # Increase Risk Scores
-            risk_scores[matched_recent_key] = risk_scores.get(matched_recent_key, 0) + 25
-            risk_scores[matched_legacy_key] = risk_scores.get(matched_legacy_key, 0) + 10
+        # Increase Risk Scores
+        risk_scores[matched_recent_key] = risk_scores.get(matched_recent_key, 0) + 25
+        risk_scores[matched_legacy_key] = risk_scores.get(matched_legacy_key, 0) + 10
 
     # 5. Base Risk Scores (Age Factors)
+    timer.stage("score_units")
     score_updates = []
     for unit in units:
         u_name = unit['unit_name']
@@ -114,7 +213,8 @@ def calculate_predictive_risks(project_id):
             
         final_score = min(current_score, 100)
         
-        if final_score > 0:
+        # Only changed scores are written; units that dropped to 0 are reset too
+        if final_score != (unit.get('risk_score') or 0):
             score_updates.append({
                 "project_id": project_id,
                 "unit_name": u_name,
@@ -123,7 +223,10 @@ def calculate_predictive_risks(project_id):
 
     # 6. Save Results
     print(f"Saving {len(risks)} legacy conflicts.")
+    timer.stage("save_results")
     save_risk_alerts(project_id, risks)
     update_unit_risk_scores(score_updates)
-    
+    timer.end()
+    print(f"Risk analysis timings: {timer.summary()}")
+
     return len(risks)
\ No newline at end of file
@@ -1,38 +1,240 @@
 import os
-import hashlib
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer
+import time
+import random
+import threading
+import numpy as np
+from openai import OpenAI, APIConnectionError, APIStatusError
 from dotenv import load_dotenv
+from src.llm_executor import RateLimiter
+from src.cache import content_cache
+from src.parser import generate_footprint
+from src.embed_server import request_embeddings, EMBED_SERVER_SOCKET
+from src.metrics import increment, observe, span
 
 load_dotenv()
 
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY"),
+# LLM_BASE_URL lets ingestion run against any OpenAI-compatible server (e.g. a local stand-in)
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "stepfun/step-3.5-flash:free")
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", "60"))
+LLM_OUTPUT_TOKEN_ESTIMATE = 256
+
+_client = None
+_client_lock = threading.Lock()
+_embed_model = None
+_model_lock = threading.Lock()
+
+def get_llm_client():
+    """Created on first use so importing this module stays cheap."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # Retries are handled below so they share the rate limiter and jitter
+                _client = OpenAI(
+                    base_url=LLM_BASE_URL,
+                    api_key=os.getenv("OPENROUTER_API_KEY"),
+                    max_retries=0,
+                )
+    return _client
+
+llm_rate_limiter = RateLimiter(
+    requests_per_minute=int(os.getenv("LLM_RPM", "0")),
+    tokens_per_minute=int(os.getenv("LLM_TPM", "0")),
 )
 
-# Load once, use everywhere
-embed_model = SentenceTransformer('all-MiniLM-L6-v2')
+EMBED_MODEL_NAME = 'all-MiniLM-L6-v2'
+# torch (default), onnx, or onnx-int8 for the quantized MiniLM export; onnx needs optimum[onnxruntime]
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+EMBED_ONNX_INT8_FILE = os.getenv("EMBED_ONNX_INT8_FILE", "onnx/model_qint8_avx2.onnx")
+EMBED_DIM = 384  # all-MiniLM-L6-v2 output size
+# Vectors from different backends aren't bit-identical, so cached ones are kept apart
+EMBED_CACHE_ID = EMBED_MODEL_NAME if EMBED_BACKEND == "torch" else f"{EMBED_MODEL_NAME}:{EMBED_BACKEND}"
+
+# Batching knobs for the embedding stage
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", "8192"))
+
+def _is_retryable(error):
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+def _retry_delay(attempt, error):
+    """Honours Retry-After when the server sends one, otherwise full-jitter exponential backoff."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return min(float(retry_after), LLM_BACKOFF_CAP)
+    except (TypeError, ValueError):
+        return random.uniform(0, min(LLM_BACKOFF_CAP, LLM_BACKOFF_BASE * 2 ** attempt))
+
+def record_llm_call(completion, started, stream):
+    """Counts one finished request; `completion` is None when it failed. Streams report no usage."""
+    mode = "stream" if stream else "complete"
+    increment("llm_requests_total", mode=mode, outcome="error" if completion is None else "ok")
+    observe("llm_request_seconds", time.perf_counter() - started, mode=mode)
+    usage = getattr(completion, "usage", None) if not stream else None
+    if usage:
+        increment("llm_tokens_total", usage.prompt_tokens or 0, kind="prompt")
+        increment("llm_tokens_total", usage.completion_tokens or 0, kind="completion")
+
+def completion_params(system_prompt, user_prompt, temperature, stream):
+    """Request body shared by the sync (ingestion) and async (chat) clients."""
+    return {
+        "extra_body": {"reasoning": {"enabled": True}},
+        "model": LLM_MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": temperature,
+        "stream": stream,
+    }
+
+def estimate_request_tokens(system_prompt, user_prompt):
+    return (len(system_prompt) + len(user_prompt)) // 4 + LLM_OUTPUT_TOKEN_ESTIMATE
+
+def retry_delay_or_raise(attempt, error, started, stream):
+    """Backoff before retrying `error`; once it isn't retryable (or retries ran out) records the failure and re-raises it."""
+    if attempt < LLM_MAX_RETRIES and _is_retryable(error):
+        delay = _retry_delay(attempt, error)
+        print(f"LLM Retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.1f}s: {error}")
+        increment("llm_retries_total")
+        return delay
+    record_llm_call(None, started, stream)
+    raise error
+
+def _create_completion(system_prompt, user_prompt, temperature, stream=False):
+    """Sends one chat completion under the rate budget, retrying 429/5xx with backoff. Raises the last error."""
+    estimated_tokens = estimate_request_tokens(system_prompt, user_prompt)
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        llm_rate_limiter.acquire(estimated_tokens)
+        started = time.perf_counter()
+        try:
+            completion = get_llm_client().chat.completions.create(
+                **completion_params(system_prompt, user_prompt, temperature, stream)
+            )
+        except Exception as e:
+            time.sleep(retry_delay_or_raise(attempt, e, started, stream))
+            continue
+        record_llm_call(completion, started, stream)
+        return completion
 
 def get_llm_completion(system_prompt, user_prompt, temperature=0.2):
     try:
-        completion = client.chat.completions.create(
-            extra_body={"reasoning": {"enabled": True}},
-            model="stepfun/step-3.5-flash:free",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=temperature
-        )
+        completion = _create_completion(system_prompt, user_prompt, temperature)
         return completion.choices[0].message.content.strip()
     except Exception as e:
         print(f"LLM Error: {e}")
         return None
 
-def get_embedding(text):
-    return embed_model.encode(text).tolist()
+def load_embed_model(backend=None):
+    """Builds a SentenceTransformer for `backend`; torch and the model weights load here, not at import."""
+    from sentence_transformers import SentenceTransformer
 
-def generate_footprint(text):
-    """Creates a unique SHA-256 hash for a string of code."""
-    return hashlib.sha256(text.encode('utf-8')).hexdigest()
\ No newline at end of file
+    backend = backend or EMBED_BACKEND
+    if backend == "onnx":
+        return SentenceTransformer(EMBED_MODEL_NAME, backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(EMBED_MODEL_NAME, backend="onnx", model_kwargs={"file_name": EMBED_ONNX_INT8_FILE})
+    return SentenceTransformer(EMBED_MODEL_NAME)
+
+def get_embed_model():
+    """Loads the embedding model once per process, on first use."""
+    global _embed_model
+    if _embed_model is None:
+        with _model_lock:
+            if _embed_model is None:
+                try:
+                    _embed_model = load_embed_model()
+                except Exception as e:
+                    if EMBED_BACKEND == "torch":
+                        raise
+                    print(f"Embedding backend {EMBED_BACKEND} unavailable ({e}); falling back to torch.")
+                    _embed_model = load_embed_model("torch")
+    return _embed_model
+
+def warmup():
+    """Loads the model (or reaches the embedding server), runs one encode and creates the LLM client."""
+    started = time.perf_counter()
+    try:
+        if EMBED_SERVER_SOCKET:
+            # The shared server owns the model; just check it answers
+            request_embeddings(["def warmup(): pass"])
+        else:
+            get_embed_model().encode(["def warmup(): pass"], convert_to_numpy=True)
+        get_llm_client()
+        print(f"Services warmed up in {time.perf_counter() - started:.1f}s ({EMBED_BACKEND} backend).")
+    except Exception as e:
+        print(f"Warmup failed, models will load on first use: {e}")
+
+def _estimate_tokens(text, max_seq_length):
+    # ~4 chars per token for code; the model truncates anything past max_seq_length
+    return min(len(text) // 4 + 2, max_seq_length)
+
+def _length_buckets(texts, batch_size, max_tokens, max_seq_length):
+    """Groups text indices by length so each batch pads to a similar size."""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batch = []
+    for i in order:
+        # Sorted ascending, so the current text sets the padded width of the batch
+        padded_cost = (len(batch) + 1) * _estimate_tokens(texts[i], max_seq_length)
+        if batch and (len(batch) >= batch_size or padded_cost > max_tokens):
+            yield batch
+            batch = []
+        batch.append(i)
+    if batch:
+        yield batch
+
+def get_embeddings(texts, batch_size=None, max_tokens=None):
+    """
+    Embeds many texts. Returns a float32 array of shape (n, dim).
+    With EMBED_SERVER_SOCKET set, the shared embedding server does the work.
+    """
+    if EMBED_SERVER_SOCKET and texts:
+        try:
+            vectors = request_embeddings(texts)
+            increment("embeddings_total", len(texts), source="server")
+            return vectors
+        except Exception as e:
+            print(f"Embedding server unavailable ({e}); encoding in-process.")
+    return embed_texts_locally(texts, batch_size, max_tokens)
+
+def embed_texts_locally(texts, batch_size=None, max_tokens=None):
+    """
+    Embeds many texts in length-sorted batches with this process's model.
+    Vectors already in the content cache are reused; only misses reach the model.
+    """
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    max_tokens = max_tokens or EMBED_MAX_BATCH_TOKENS
+
+    keys = [f"embed:{EMBED_CACHE_ID}:{generate_footprint(text)}" for text in texts]
+    cached_vectors = [content_cache.get(key) for key in keys]
+    missing = [i for i, cached in enumerate(cached_vectors) if cached is None]
+
+    vectors = np.zeros((len(texts), EMBED_DIM), dtype=np.float32)
+    for i, cached in enumerate(cached_vectors):
+        if cached is not None:
+            vectors[i] = np.frombuffer(cached, dtype=np.float32)
+    increment("embeddings_total", len(texts) - len(missing), source="cache")
+    # Fully cached calls never load the model
+    if not missing:
+        return vectors
+
+    embed_model = get_embed_model()
+    missing_texts = [texts[i] for i in missing]
+    for idx in _length_buckets(missing_texts, batch_size, max_tokens, embed_model.max_seq_length):
+        with span("embed_batch_seconds"):
+            encoded = embed_model.encode([missing_texts[j] for j in idx], batch_size=len(idx), convert_to_numpy=True)
+        increment("embeddings_total", len(idx), source="model")
+        for j, vector in zip(idx, encoded.astype(np.float32, copy=False)):
+            vectors[missing[j]] = vector
+            content_cache.set(keys[missing[j]], vector.tobytes())
+    return vectors
+
+def get_embedding(text):
+    return get_embeddings([text])[0].tolist()
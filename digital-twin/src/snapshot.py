@@ -0,0 +1,235 @@
+"""
+Compact on-disk snapshot of the twin's memory and call graph.
+
+A snapshot is a directory holding:
+  manifest.json            commit, counts, embedding dtype and the file list
+  <column>.bin/.off        string columns: concatenated UTF-8 plus int64 offsets
+  calls.bin/.off/.rows     per-unit call lists: a string column plus int64 row offsets
+  embeddings.bin           (units, dim) float32 or float16, memory-mapped on access
+  graph_{out,in}_*.bin     CSR adjacency (int64 indptr, int32 indices) over graph_nodes
+
+Nothing is parsed up front: `Snapshot` reads the manifest and maps the other files
+as they are touched. Convert the JSON files the twin used to write with:
+
+    python -m src.snapshot memory/lumis_memory.json memory/lumis_graph.json memory/lumis_snapshot [--dtype float16]
+"""
+import os
+import json
+import shutil
+import argparse
+import numpy as np
+
+SNAPSHOT_FORMAT_VERSION = 1
+UNIT_COLUMNS = ("id", "file_path", "summary", "footprint")
+
+def _write_strings(path, name, values):
+    encoded = [(value or "").encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    with open(os.path.join(path, f"{name}.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    offsets.tofile(os.path.join(path, f"{name}.off"))
+
+def _csr(node_count, sources, targets):
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=node_count), out=indptr[1:])
+    return indptr, targets[order].astype(np.int32)
+
+def write_snapshot(path, last_commit, units, graph_nodes, graph_edges, dtype="float32"):
+    """
+    Writes a snapshot directory, replacing any previous one at `path`.
+    `units` are dicts with id, file_path, summary, footprint, embedding and calls;
+    `graph_nodes` are dicts with id (and optionally summary); `graph_edges` are (source, target).
+    """
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    for column in UNIT_COLUMNS:
+        _write_strings(tmp_path, column, [unit.get(column) for unit in units])
+
+    calls = [unit.get("calls") or [] for unit in units]
+    _write_strings(tmp_path, "calls", [call for unit_calls in calls for call in unit_calls])
+    rows = np.zeros(len(units) + 1, dtype=np.int64)
+    np.cumsum([len(unit_calls) for unit_calls in calls], out=rows[1:])
+    rows.tofile(os.path.join(tmp_path, "calls.rows"))
+
+    dim = next((len(unit["embedding"]) for unit in units if unit.get("embedding")), 0)
+    embeddings = np.zeros((len(units), dim), dtype=np.dtype(dtype))
+    for i, unit in enumerate(units):
+        if unit.get("embedding"):
+            embeddings[i] = unit["embedding"]
+    embeddings.tofile(os.path.join(tmp_path, "embeddings.bin"))
+    np.array([bool(unit.get("embedding")) for unit in units], dtype=np.uint8).tofile(os.path.join(tmp_path, "has_embedding.bin"))
+
+    # Edges may name nodes the node list doesn't have (call targets); they are added
+    node_ids = [node["id"] for node in graph_nodes]
+    positions = {node_id: i for i, node_id in enumerate(node_ids)}
+    summaries = [node.get("summary") for node in graph_nodes]
+    for source, target in graph_edges:
+        for node_id in (source, target):
+            if node_id not in positions:
+                positions[node_id] = len(node_ids)
+                node_ids.append(node_id)
+                summaries.append(None)
+    _write_strings(tmp_path, "graph_nodes", node_ids)
+    _write_strings(tmp_path, "graph_node_summary", summaries)
+
+    sources = np.array([positions[s] for s, _ in graph_edges], dtype=np.int64)
+    targets = np.array([positions[t] for _, t in graph_edges], dtype=np.int64)
+    for direction, (src, dst) in (("out", (sources, targets)), ("in", (targets, sources))):
+        indptr, indices = _csr(len(node_ids), src, dst)
+        indptr.tofile(os.path.join(tmp_path, f"graph_{direction}_indptr.bin"))
+        indices.tofile(os.path.join(tmp_path, f"graph_{direction}_indices.bin"))
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "last_commit": last_commit,
+        "unit_count": len(units),
+        "embedding_dim": dim,
+        "embedding_dtype": np.dtype(dtype).name,
+        "node_count": len(node_ids),
+        "edge_count": len(graph_edges),
+    }
+    with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return manifest
+
+class StringColumn:
+    """Read-only view of a string column; values are decoded one at a time."""
+
+    def __init__(self, path, name):
+        self._offsets = np.memmap(os.path.join(path, f"{name}.off"), dtype=np.int64, mode="r")
+        data_path = os.path.join(path, f"{name}.bin")
+        # Zero-length files can't be mapped
+        self._data = np.memmap(data_path, dtype=np.uint8, mode="r") if os.path.getsize(data_path) else b""
+        self._positions = None
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return bytes(self._data[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def index(self, value):
+        """Position of `value`; the lookup table is built on first use."""
+        if self._positions is None:
+            self._positions = {item: i for i, item in enumerate(self)}
+        return self._positions[value]
+
+class Snapshot:
+    """Lazily opened snapshot written by `write_snapshot`."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {self.manifest.get('format_version')} at {path}")
+        self._columns = {}
+        self._arrays = {}
+
+    @property
+    def last_commit(self):
+        return self.manifest.get("last_commit")
+
+    def __len__(self):
+        return self.manifest["unit_count"]
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = StringColumn(self.path, name)
+        return self._columns[name]
+
+    def _array(self, name, dtype, shape=None):
+        if name not in self._arrays:
+            file_path = os.path.join(self.path, name)
+            if os.path.getsize(file_path) == 0:
+                self._arrays[name] = np.zeros(shape or (0,), dtype=dtype)
+            else:
+                self._arrays[name] = np.memmap(file_path, dtype=dtype, mode="r", shape=shape)
+        return self._arrays[name]
+
+    @property
+    def embeddings(self):
+        """(units, dim) memory-mapped array; rows without an embedding are zero."""
+        shape = (len(self), self.manifest["embedding_dim"])
+        return self._array("embeddings.bin", self.manifest["embedding_dtype"], shape)
+
+    def has_embedding(self, i):
+        return bool(self._array("has_embedding.bin", np.uint8)[i])
+
+    def calls(self, i):
+        rows = self._array("calls.rows", np.int64)
+        column = self.column("calls")
+        return [column[j] for j in range(rows[i], rows[i + 1])]
+
+    def unit(self, i):
+        """One unit as a dict in the shape of lumis_memory.json entries."""
+        unit = {column: self.column(column)[i] for column in UNIT_COLUMNS}
+        unit["calls"] = self.calls(i)
+        unit["embedding"] = self.embeddings[i].astype(np.float32).tolist() if self.has_embedding(i) else None
+        return unit
+
+    def find_unit(self, unit_id):
+        return self.unit(self.column("id").index(unit_id))
+
+    def _neighbours(self, direction, node_id):
+        nodes = self.column("graph_nodes")
+        try:
+            position = nodes.index(node_id)
+        except KeyError:
+            return []
+        indptr = self._array(f"graph_{direction}_indptr.bin", np.int64)
+        indices = self._array(f"graph_{direction}_indices.bin", np.int32)
+        return [nodes[j] for j in indices[indptr[position]:indptr[position + 1]]]
+
+    def successors(self, node_id):
+        return self._neighbours("out", node_id)
+
+    def predecessors(self, node_id):
+        return self._neighbours("in", node_id)
+
+def convert_json_snapshot(memory_path, graph_path, out_path, dtype="float32"):
+    """
+    Converts lumis_memory.json (a {"last_commit"} header followed by units) and
+    lumis_graph.json (networkx node-link data) into a snapshot directory.
+    """
+    with open(memory_path) as f:
+        memory = json.load(f)
+    header = memory[0] if memory and "last_commit" in memory[0] else {}
+    units = memory[1:] if header else memory
+
+    nodes, edges = [], []
+    if graph_path and os.path.exists(graph_path):
+        with open(graph_path) as f:
+            graph = json.load(f)
+        nodes = graph.get("nodes", [])
+        # networkx writes "links" before 3.4 and "edges" after
+        edges = [(edge["source"], edge["target"]) for edge in graph.get("edges", graph.get("links", []))]
+
+    return write_snapshot(out_path, header.get("last_commit"), units, nodes, edges, dtype)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the JSON memory/graph files into a binary snapshot.")
+    parser.add_argument("memory_json")
+    parser.add_argument("graph_json")
+    parser.add_argument("out_dir")
+    parser.add_argument("--dtype", choices=("float32", "float16"), default="float32")
+    args = parser.parse_args()
+
+    manifest = convert_json_snapshot(args.memory_json, args.graph_json, args.out_dir, args.dtype)
+    size = sum(os.path.getsize(os.path.join(args.out_dir, name)) for name in os.listdir(args.out_dir))
+    print(f"Wrote {manifest['unit_count']} units, {manifest['node_count']} nodes and "
+          f"{manifest['edge_count']} edges to {args.out_dir} ({size / 1024:.1f} KiB).")
+
+if __name__ == "__main__":
+    main()
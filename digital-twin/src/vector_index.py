@@ -0,0 +1,340 @@
+import os
+import json
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Serve chat retrieval from a local per-project index instead of the match_memory_units RPC
+VECTOR_INDEX_ENABLED = os.getenv("LOCAL_VECTOR_INDEX", "0") == "1"
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join("memory", "vector_index"))
+# float32 keeps exact scores; int8 stores a quarter of the bytes with one scale per vector
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+# IVF lists scanned per query; more lists trade latency for recall
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "32"))
+# Below this many vectors a brute-force scan is faster than probing lists
+VECTOR_INDEX_MIN_TRAIN = int(os.getenv("VECTOR_INDEX_MIN_TRAIN", "2048"))
+
+EMBED_DIM = 384
+KMEANS_ITERATIONS = 10
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class LocalVectorIndex:
+    """
+    Cosine-similarity index over one project's unit embeddings.
+
+    Vectors live in a memory-mapped file of fixed-size slots; deleted slots are reused.
+    Once trained, each slot is assigned to its nearest k-means centroid (IVF) and a query
+    only scores the slots of its `nprobe` closest lists. `synced_commit` records which
+    commit the contents match; it is cleared while an ingestion is applying changes.
+    Other processes' saves are picked up by refresh().
+    """
+
+    def __init__(self, path, dim=EMBED_DIM, dtype=VECTOR_INDEX_DTYPE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.dim = dim
+        self.dtype = dtype
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self.capacity = 0
+        self.ids = []
+        self.slots = {}
+        self.free = []
+        self.centroids = None
+        self.trained_count = 0
+        self.synced_commit = None
+        self._vectors = self._scales = self._lists = None
+        self._meta_stamp = None
+
+    # --- storage ---
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _open_arrays(self):
+        if not self.capacity:
+            self._vectors = self._scales = self._lists = None
+            return
+        vector_dtype = np.int8 if self.dtype == "int8" else np.float32
+        self._vectors = np.memmap(self._file("vectors.bin"), dtype=vector_dtype, mode="r+", shape=(self.capacity, self.dim))
+        self._lists = np.memmap(self._file("lists.bin"), dtype=np.int32, mode="r+", shape=(self.capacity,))
+        if self.dtype == "int8":
+            self._scales = np.memmap(self._file("scales.bin"), dtype=np.float32, mode="r+", shape=(self.capacity,))
+
+    def _grow(self, needed):
+        capacity = max(1024, self.capacity)
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        item_size = 1 if self.dtype == "int8" else 4
+        files = [("vectors.bin", self.dim * item_size), ("lists.bin", 4)]
+        if self.dtype == "int8":
+            files.append(("scales.bin", 4))
+        self._flush()
+        self._vectors = self._scales = self._lists = None
+        for name, row_bytes in files:
+            with open(self._file(name), "ab") as f:
+                f.truncate(capacity * row_bytes)
+        old_capacity, self.capacity = self.capacity, capacity
+        self._open_arrays()
+        self._lists[old_capacity:] = -1
+
+    def _flush(self):
+        for array in (self._vectors, self._scales, self._lists):
+            if array is not None:
+                array.flush()
+
+    def _read_meta_stamp(self):
+        # meta.json is replaced atomically on every save, so inode + mtime identify a version
+        try:
+            stat = os.stat(self._file("meta.json"))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self):
+        meta_path = self._file("meta.json")
+        self._meta_stamp = self._read_meta_stamp()
+        if self._meta_stamp is None:
+            return
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("dim") != self.dim or meta.get("dtype") != self.dtype:
+            print(f"Vector index at {self.path} has a different layout; it will be rebuilt.")
+            return
+        self.capacity = meta["capacity"]
+        self.ids = meta["ids"]
+        self.trained_count = meta.get("trained_count", 0)
+        self.synced_commit = meta.get("synced_commit")
+        self.slots = {name: slot for slot, name in enumerate(self.ids) if name is not None}
+        self.free = [slot for slot, name in enumerate(self.ids) if name is None]
+        if os.path.exists(self._file("centroids.npy")):
+            self.centroids = np.load(self._file("centroids.npy"))
+        self._open_arrays()
+
+    def save(self):
+        with self.lock:
+            os.makedirs(self.path, exist_ok=True)
+            self._flush()
+            if self.centroids is not None:
+                np.save(self._file("centroids.npy"), self.centroids)
+            meta = {
+                "dim": self.dim, "dtype": self.dtype, "capacity": self.capacity,
+                "ids": self.ids, "trained_count": self.trained_count,
+                "synced_commit": self.synced_commit,
+            }
+            tmp_path = self._file("meta.json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self._file("meta.json"))
+            self._meta_stamp = self._read_meta_stamp()
+
+    def refresh(self):
+        """Reloads from disk when another process (another uvicorn worker's ingestion) saved since."""
+        with self.lock:
+            if self._read_meta_stamp() == self._meta_stamp:
+                return
+            self._reset()
+            self._load()
+
+    # --- updates ---
+
+    def __len__(self):
+        return len(self.slots)
+
+    def begin_update(self):
+        """Marks the index dirty on disk so a crashed ingestion forces a rebuild."""
+        with self.lock:
+            self.synced_commit = None
+            self.save()
+
+    def commit(self, commit_sha):
+        with self.lock:
+            if len(self) >= VECTOR_INDEX_MIN_TRAIN and len(self) > 2 * self.trained_count:
+                self.train()
+            self.synced_commit = commit_sha
+            self.save()
+
+    def clear(self):
+        with self.lock:
+            self.ids, self.slots, self.free = [], {}, []
+            self.centroids, self.trained_count = None, 0
+            if self._lists is not None:
+                self._lists[:] = -1
+
+    def _assign(self, vectors):
+        if self.centroids is None:
+            return np.zeros(len(vectors), dtype=np.int32)
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _write(self, slots, vectors):
+        if self.dtype == "int8":
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            self._vectors[slots] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self._scales[slots] = scales
+        else:
+            self._vectors[slots] = vectors
+        self._lists[slots] = self._assign(vectors)
+
+    def upsert(self, names, vectors):
+        if not names:
+            return
+        vectors = _normalize(vectors).reshape(len(names), self.dim)
+        with self.lock:
+            slots = []
+            for name in names:
+                slot = self.slots.get(name)
+                if slot is None:
+                    if self.free:
+                        slot = self.free.pop()
+                        self.ids[slot] = name
+                    else:
+                        slot = len(self.ids)
+                        self.ids.append(name)
+                    self.slots[name] = slot
+                slots.append(slot)
+            self._grow(len(self.ids))
+            self._write(np.array(slots), vectors)
+
+    def delete(self, names):
+        with self.lock:
+            for name in names:
+                slot = self.slots.pop(name, None)
+                if slot is not None:
+                    self.ids[slot] = None
+                    self.free.append(slot)
+                    self._lists[slot] = -1
+
+    def _decode(self, slots):
+        vectors = np.asarray(self._vectors[slots], dtype=np.float32)
+        if self.dtype == "int8":
+            vectors *= self._scales[slots][:, None]
+        return vectors
+
+    def train(self, seed=0):
+        """Spherical k-means over a sample of the live vectors, then reassigns every slot."""
+        with self.lock:
+            live = np.fromiter(self.slots.values(), dtype=np.int64, count=len(self.slots))
+            if not len(live):
+                return
+            nlist = int(min(4096, max(16, 4 * np.sqrt(len(live)))))
+            rng = np.random.default_rng(seed)
+            sample = self._decode(np.sort(rng.choice(live, size=min(len(live), 64 * nlist), replace=False)))
+            nlist = min(nlist, len(sample))
+
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+            for _ in range(KMEANS_ITERATIONS):
+                assignment = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, sample)
+                empty = ~np.bincount(assignment, minlength=nlist).astype(bool)
+                sums[empty] = centroids[empty]
+                centroids = _normalize(sums)
+
+            self.centroids = centroids.astype(np.float32)
+            for start in range(0, len(live), 65536):
+                batch = np.sort(live[start:start + 65536])
+                self._lists[batch] = self._assign(self._decode(batch))
+            self.trained_count = len(live)
+
+    # --- search ---
+
+    def search(self, query, k=8, threshold=None, nprobe=VECTOR_INDEX_NPROBE):
+        """Returns up to k (unit_name, similarity) pairs, best first."""
+        query = _normalize(query).reshape(self.dim)
+        with self.lock:
+            count = len(self.ids)
+            if not self.slots:
+                return []
+            lists = np.asarray(self._lists[:count])
+            if self.centroids is not None and nprobe < len(self.centroids):
+                probe = np.argpartition(-(self.centroids @ query), nprobe)[:nprobe]
+                candidates = np.flatnonzero(np.isin(lists, probe))
+            else:
+                candidates = np.flatnonzero(lists >= 0)
+            if not len(candidates):
+                return []
+
+            scores = self._decode(candidates) @ query
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                (self.ids[candidates[i]], float(scores[i]))
+                for i in top if threshold is None or scores[i] > threshold
+            ]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_vector_index(project_id):
+    with _indexes_lock:
+        index = _indexes.get(project_id)
+        if index is None:
+            index = _indexes[project_id] = LocalVectorIndex(os.path.join(VECTOR_INDEX_DIR, str(project_id)))
+        return index
+
+def begin_index_update(project_id, base_commit, has_units):
+    """
+    Returns the project's index when it matches `base_commit` so ingestion can apply its
+    changes in place, or None when it must be rebuilt from the database afterwards.
+    """
+    if not VECTOR_INDEX_ENABLED:
+        return None
+    index = get_vector_index(project_id)
+    with index.lock:
+        index.refresh()
+        if not has_units:
+            index.clear()
+        elif index.synced_commit is None or index.synced_commit != base_commit:
+            return None
+        index.begin_update()
+        return index
+
+def rebuild_vector_index(project_id, commit_sha):
+    # Imported here so the index (and its benchmark) works without Supabase credentials
+    from src.db_client import iter_unit_embeddings
+
+    index = get_vector_index(project_id)
+    with index.lock:
+        index.refresh()
+        index.begin_update()
+        index.clear()
+        for page in iter_unit_embeddings(project_id):
+            if page:
+                names, vectors = zip(*page)
+                index.upsert(list(names), np.array(vectors, dtype=np.float32))
+        index.commit(commit_sha)
+    print(f"Rebuilt local vector index for {project_id}: {len(index)} units.")
+
+def finish_index_update(project_id, index, commit_sha):
+    """Marks an in-place update as synced to `commit_sha`, or rebuilds when there was none."""
+    if not VECTOR_INDEX_ENABLED:
+        return
+    try:
+        if index is not None:
+            index.commit(commit_sha)
+        else:
+            rebuild_vector_index(project_id, commit_sha)
+    except Exception as e:
+        print(f"Local vector index update failed for {project_id}: {e}")
+
+def search_vector_index(project_id, commit_sha, query_vector, k, threshold):
+    """(unit_name, similarity) matches, or None when the local index can't answer for this commit."""
+    if not VECTOR_INDEX_ENABLED:
+        return None
+    index = get_vector_index(project_id)
+    # One stat per query keeps workers that didn't run the ingestion in step with the one that did
+    index.refresh()
+    if index.synced_commit is None or index.synced_commit != commit_sha:
+        return None
+    return index.search(query_vector, k, threshold)